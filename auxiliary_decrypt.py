@@ -12,6 +12,7 @@ DEFAULT_FILES = [
 
 KEY = b"\x24\xfa\x49\x9b\x10\x8d\x62\x59\x29\x26\x81\x67\x4b\xf7\x91\xeb"
 HEADER_BYTES = b"\x0c\x07\x08\x0d\x0b\x09"
+STREAM_CHUNK = 1 << 20
 
 def get_user_input():
     print("=== 配置解密目标 ===")
@@ -37,37 +38,46 @@ def decrypt_specific_file(file_path):
         return
 
     try:
+        header_len = len(HEADER_BYTES)
         with open(file_path, "rb") as f:
-            enc = f.read()
+            size = os.fstat(f.fileno()).st_size
+            if size <= header_len or f.read(header_len) != HEADER_BYTES:
+                print(f"[错误] 文件头不匹配 (可能未加密): {os.path.basename(file_path)}")
+                return
+
+            # 直接读进补齐 4 字节的缓冲区，省掉拼接补 0 的那次复制
+            n = size - header_len
+            data_to_decrypt = bytearray(n + (4 - n % 4) % 4)
+            f.readinto(memoryview(data_to_decrypt)[:n])
 
-        header_len = len(HEADER_BYTES)
-        if len(enc) <= header_len or enc[:header_len] != HEADER_BYTES:
-            print(f"[错误] 文件头不匹配 (可能未加密): {os.path.basename(file_path)}")
-            return
-        
-        ed = enc[header_len:]
-        pad_len = (4 - (len(ed) % 4)) % 4
-        data_to_decrypt = ed + b"\x00" * pad_len
         decrypted_raw = xxtea.decrypt(data_to_decrypt, KEY, padding=False)
+        del data_to_decrypt
 
         if not decrypted_raw:
             print(f"[错误] 解密失败: {file_path}")
             return
 
-        try:
-            decompressed_data = zlib.decompress(decrypted_raw[1:])
-        except zlib.error as e:
-            print(f"[错误] 解压失败: {e}")
-            return
-
         # 保存
         dir_name = os.path.dirname(file_path)
         base_name = os.path.basename(file_path)
         out_name = f"decrypted_{base_name}.txt"
         out_path = os.path.join(dir_name, out_name)
 
-        with open(out_path, "wb") as f_out:
-            f_out.write(decompressed_data)
+        # 分块解压并直接写盘 (memoryview 跳过首字节，不复制)
+        view = memoryview(decrypted_raw)[1:]
+        d = zlib.decompressobj()
+        try:
+            with open(out_path, "wb") as f_out:
+                for i in range(0, len(view), STREAM_CHUNK):
+                    f_out.write(d.decompress(view[i:i + STREAM_CHUNK]))
+                    if d.eof: break
+                f_out.write(d.flush())
+            if not d.eof:
+                raise zlib.error("incomplete or truncated stream")
+        except zlib.error as e:
+            os.remove(out_path)
+            print(f"[错误] 解压失败: {e}")
+            return
 
         print(f"[成功] 已保存: {out_path}")
 
@@ -0,0 +1,284 @@
+import os
+import io
+import sys
+import time
+import zlib
+import shutil
+import random
+import zipfile
+import argparse
+import tempfile
+import importlib
+import tracemalloc
+import xxtea
+
+# ================= 默认配置 =================
+# 用项目的 KEY / HEADER_BYTES 离线生成加密样本，不需要真实的游戏文件
+KEY = b"\x24\xfa\x49\x9b\x10\x8d\x62\x59\x29\x26\x81\x67\x4b\xf7\x91\xeb"
+HEADER_BYTES = b"\x0c\x07\x08\x0d\x0b\x09"
+
+DEFAULT_MODULES = ["restore_kanojo_final_v5", "restore_kanojo_final_v6"]
+DEFAULT_SIZES = ["4K", "64K", "1M", "16M"]
+DEFAULT_ENTRIES = 200000     # 假 protector / bundle 列表的总条数
+DEFAULT_TREE_FILES = 2000    # decrypt_and_save 阶段的文件数
+DEFAULT_XXTEA_FILES = 4000   # XXTEA 批量解密对比的小文件数
+DEFAULT_XXTEA_SIZES = ["1K", "4K"]
+# ===========================================
+
+def parse_size(text):
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    text = text.strip().upper()
+    if text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="解密/还原热点路径基准测试 (合成样本)")
+    parser.add_argument("--modules", default=",".join(DEFAULT_MODULES),
+                        help=f"要对比的还原脚本模块名，逗号分隔 (默认: {','.join(DEFAULT_MODULES)})")
+    parser.add_argument("--sizes", default=",".join(DEFAULT_SIZES),
+                        help=f"单个样本的大小，逗号分隔 (默认: {','.join(DEFAULT_SIZES)})")
+    parser.add_argument("--entries", type=int, default=DEFAULT_ENTRIES,
+                        help=f"假映射表条数 (默认: {DEFAULT_ENTRIES})")
+    parser.add_argument("--tree-files", type=int, default=DEFAULT_TREE_FILES,
+                        help=f"decrypt_and_save 阶段的文件数 (默认: {DEFAULT_TREE_FILES})")
+    parser.add_argument("--xxtea-files", type=int, default=DEFAULT_XXTEA_FILES,
+                        help=f"xxtea C 扩展 vs NumPy 批量解密对比的文件数，0 为跳过 (默认: {DEFAULT_XXTEA_FILES})")
+    parser.add_argument("--xxtea-sizes", default=",".join(DEFAULT_XXTEA_SIZES),
+                        help=f"对比用的小文件大小，逗号分隔 (默认: {','.join(DEFAULT_XXTEA_SIZES)})")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+# ================= 合成样本 =================
+def payload(kind, size, rng):
+    """生成指定类型的明文：一半随机字节 (难压缩) + 一半重复字节 (易压缩)"""
+    magic = {
+        'png': b"\x89PNG\r\n\x1a\n",
+        'ogg': b"OggS\x00\x02",
+        'unity': b"UnityFS\x00\x00\x00\x00\x08",
+    }[kind]
+    body = max(0, size - len(magic))
+    half = body // 2
+    return magic + rng.randbytes(half) + b"\x00" * (body - half)
+
+def encrypt(data):
+    """与 smart_decrypt 对应：HEADER + XXTEA(1 字节前缀 + zlib 数据，补齐 4 字节)"""
+    plain = b"\x01" + zlib.compress(data)
+    plain += b"\x00" * ((4 - len(plain) % 4) % 4)
+    return HEADER_BYTES + xxtea.encrypt(plain, KEY, padding=False)
+
+def zipped(data, name="0", depth=1):
+    for _ in range(depth):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as z:
+            z.writestr(name, data)
+        data = buf.getvalue()
+    return data
+
+def build_blobs(sizes, rng):
+    """返回 [(名称, 原始大小, 加密/封装后的数据)]"""
+    blobs = []
+    for size in sizes:
+        label = f"{size >> 10}K" if size < (1 << 20) else f"{size >> 20}M"
+        png = payload('png', size, rng)
+        blobs.append((f"xxtea+zlib {label}", size, encrypt(png)))
+        blobs.append((f"zip(xxtea) {label}", size, zipped(encrypt(png))))
+        blobs.append((f"zip(zip(xxtea)) {label}", size, zipped(encrypt(png), depth=2)))
+        for kind in ('png', 'ogg', 'unity'):
+            blobs.append((f"raw {kind} {label}", size, payload(kind, size, rng)))
+    return blobs
+
+def build_lists(root, entries, rng):
+    """生成假的 protector / bundle 列表 (明文格式，与 decrypted_xxx.dat.txt 相同)"""
+    names = ["1.png", "A.atlas", "A.json", "bgm.mp3", "se.ogg"]
+    prot_path = os.path.join(root, "decrypted_protector.dat.txt")
+    bundle_path = os.path.join(root, "decrypted_bundle_file_list.dat.txt")
+    n_bundle = entries // 4
+    with open(bundle_path, "w", encoding="utf-8") as f:
+        for i in range(n_bundle):
+            f.write(f"{i:032x} {rng.randint(100, 1 << 20)} 0 0 0 b{i % 64:02x}/{i:032x},x\n")
+    with open(prot_path, "w", encoding="utf-8") as f:
+        for i in range(entries - n_bundle):
+            f.write(f"{rng.choice(names)} {i % 256:02x}/{i:032x}\n")
+    return [prot_path], bundle_path
+
+def build_tree(root, n_files, rng):
+    """生成模拟 files 目录：hotRes (protector 命中) / bundleRes (bundle 命中) / 未命中文件"""
+    total = 0
+    for i in range(n_files):
+        size = rng.choice((1 << 10, 8 << 10, 64 << 10))
+        kind = i % 4
+        if kind == 0:
+            rel, data = f"hotRes/{i % 256:02x}/{i:032x}", encrypt(payload('png', size, rng))
+        elif kind == 1:
+            rel, data = f"hotRes/{i % 256:02x}/{i:032x}", payload('ogg', size, rng)
+        elif kind == 2:
+            rel, data = f"bundleRes/b{i % 64:02x}/{i:032x}", encrypt(payload('unity', size, rng))
+        else:
+            rel, data = f"Unknown/{i % 16:x}/{i:08x}", zipped(encrypt(payload('png', size, rng)))
+        path = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        total += len(data)
+    return total
+
+# ================= 计时 =================
+def measure(fn, repeat=1):
+    """先正常计时，再单独跑一遍 tracemalloc 取峰值 (避免 tracemalloc 拖慢计时)"""
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - t0) / repeat
+
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak
+
+def report(module, stage, elapsed, peak, mb=None, files=None):
+    parts = [f"{module:<26}", f"{stage:<32}", f"{elapsed * 1000:>9.1f} ms"]
+    parts.append(f"{mb / elapsed:>9.1f} MB/s" if mb is not None and elapsed > 0 else f"{'':>14}")
+    parts.append(f"{files / elapsed:>11.0f} items/s" if files is not None and elapsed > 0 else f"{'':>19}")
+    parts.append(f"peak {peak / (1 << 20):>7.1f} MB")
+    print("  ".join(parts))
+
+def bench_module(name, blobs, prot_list, bundle_list, tree_root, tree_bytes, tree_files):
+    try:
+        mod = importlib.import_module(name)
+    except Exception as e:
+        print(f"{name:<26}  [跳过] 无法导入: {e}")
+        return
+
+    # 1. smart_decrypt (内存中的单个样本)
+    if hasattr(mod, "smart_decrypt"):
+        for label, size, blob in blobs:
+            repeat = max(1, (32 << 20) // max(size, 1))
+            elapsed, peak = measure(lambda: mod.smart_decrypt(blob), min(repeat, 200))
+            report(name, f"smart_decrypt {label}", elapsed, peak, mb=size / (1 << 20))
+
+    # 2. guess_extension (只看文件头，按文件数计)
+    if hasattr(mod, "guess_extension"):
+        heads = [payload(k, 4096, random.Random(0)) for k in ('png', 'ogg', 'unity')] + [b"\nA.png\nsize: 1,1\n" * 8]
+        n = 50000
+        elapsed, peak = measure(lambda: [mod.guess_extension(heads[i & 3]) for i in range(n)])
+        report(name, "guess_extension", elapsed, peak, files=n)
+
+    # 3. load_mappings
+    mapping = None
+    if hasattr(mod, "load_mappings"):
+        result = {}
+        def load():
+            with open(os.devnull, "w") as devnull:
+                stdout, sys.stdout = sys.stdout, devnull
+                try: result['m'] = mod.load_mappings(prot_list, bundle_list)
+                finally: sys.stdout = stdout
+        try:
+            elapsed, peak = measure(load)
+            mapping = result['m']
+            report(name, f"load_mappings ({len(mapping)})", elapsed, peak, files=len(mapping))
+        except TypeError as e:
+            print(f"{name:<26}  load_mappings 签名不兼容: {e}")
+
+    # 4. decrypt_and_save (整棵目录)
+    if mapping is not None and hasattr(mod, "decrypt_and_save"):
+        out_root = tree_root + "_out"
+        files = [os.path.join(dp, f) for dp, _, fs in os.walk(tree_root) for f in fs]
+        def run():
+            shutil.rmtree(out_root, ignore_errors=True)
+            for path in files:
+                mod.decrypt_and_save(path, mapping, tree_root, out_root)
+        try:
+            elapsed, peak = measure(run)
+            report(name, f"decrypt_and_save ({tree_files})", elapsed, peak, mb=tree_bytes / (1 << 20), files=tree_files)
+        except TypeError as e:
+            print(f"{name:<26}  decrypt_and_save 签名不兼容: {e}")
+        shutil.rmtree(out_root, ignore_errors=True)
+
+def bench_manifest(prot_path, work):
+    """清单读取：明文 .txt / 加密 .dat 首次 (解密并写缓存) / 缓存命中 / 不用缓存直接解密解析"""
+    try:
+        import manifest_cache
+    except ImportError as e:
+        print(f"{'manifest_cache':<26}  [跳过] 无法导入: {e}")
+        return
+    dat_path = os.path.join(work, "protector.dat")
+    with open(prot_path, "rb") as f:
+        plain = f.read()
+    with open(dat_path, "wb") as f:
+        f.write(encrypt(plain))
+    cache_dir = os.path.join(work, manifest_cache.CACHE_DIR_NAME)
+    mb = len(plain) / (1 << 20)
+    n = plain.count(b"\n")
+
+    def cold():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        manifest_cache.load_manifest_rows(dat_path)
+    def no_cache():
+        with open(dat_path, "rb") as f:
+            manifest_cache.parse_rows(manifest_cache.decrypt_manifest(f.read()))
+    cases = [("明文 .txt", lambda: manifest_cache.load_manifest_rows(prot_path)),
+             ("加密 .dat 首次", cold),
+             ("加密 .dat 缓存命中", lambda: manifest_cache.load_manifest_rows(dat_path)),
+             ("加密 .dat 不用缓存", no_cache)]
+    for label, fn in cases:
+        elapsed, peak = measure(fn, 3)
+        report("manifest_cache", f"{label} ({n})", elapsed, peak, mb=mb, files=n)
+
+def bench_xxtea(n_files, sizes, rng):
+    """模拟大量 hotRes 小文件：逐个调用 xxtea C 扩展 vs xxtea_numpy 一次批量解密，并核对结果一致"""
+    try:
+        import xxtea_numpy
+    except ImportError as e:
+        print(f"{'xxtea_numpy':<26}  [跳过] 无法导入: {e}")
+        return
+    for size in sizes:
+        size -= size % 4
+        label = f"{size >> 10}K" if size >= 1024 else f"{size}B"
+        bufs = [rng.randbytes(size) for _ in range(n_files)]
+        mb = size * n_files / (1 << 20)
+
+        result = {}
+        def one_by_one():
+            result['c'] = [xxtea.decrypt(b, KEY, padding=False) for b in bufs]
+        def batched():
+            result['np'] = xxtea_numpy.decrypt_batch(bufs, KEY)
+        elapsed, peak = measure(one_by_one)
+        report("xxtea (C)", f"decrypt {n_files} x {label}", elapsed, peak, mb=mb, files=n_files)
+        elapsed, peak = measure(batched)
+        report("xxtea_numpy", f"decrypt_batch {n_files} x {label}", elapsed, peak, mb=mb, files=n_files)
+        if result['c'] != result['np']:
+            print(f"{'xxtea_numpy':<26}  [错误] 与 xxtea.decrypt 结果不一致")
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    modules = [m.strip() for m in args.modules.split(",") if m.strip()]
+
+    work = tempfile.mkdtemp(prefix="kanojo_bench_")
+    try:
+        print(f"生成合成样本: {work}")
+        blobs = build_blobs(sizes, rng)
+        prot_list, bundle_list = build_lists(work, args.entries, rng)
+        tree_root = os.path.join(work, "files")
+        tree_bytes = build_tree(tree_root, args.tree_files, rng)
+        print(f"样本: {len(blobs)} 个 blob, 映射表 {args.entries} 条, 目录 {args.tree_files} 个文件 ({tree_bytes / (1 << 20):.1f} MB)\n")
+
+        for name in modules:
+            bench_module(name, blobs, prot_list, bundle_list, tree_root, tree_bytes, args.tree_files)
+            print()
+
+        bench_manifest(prot_list[0], work)
+        print()
+
+        if args.xxtea_files > 0:
+            bench_xxtea(args.xxtea_files, [parse_size(s) for s in args.xxtea_sizes.split(",") if s.strip()], rng)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
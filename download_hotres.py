@@ -1,15 +1,58 @@
 import os
+import time
+import fnmatch
+import argparse
+import asyncio
+import hashlib
+import marshal
+import threading
 import requests
 import concurrent.futures
+from collections import Counter
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from tqdm import tqdm
 
+from manifest_cache import load_manifest_rows, CACHE_DIR_NAME
+
+try:
+    import aiohttp     # 仅 --engine asyncio 需要
+except ImportError:
+    aiohttp = None
+
 # ================= 默认配置 =================
 DEFAULT_MANIFESTS = [
     r"D:\Download\tmp\jp.sunny.kanojo\files\hotRes\hot_file_list.dat",
-    r"D:\Download\tmp\jp.sunny.kanojo\files\bundleRes\decrypted_bundle_file_list.dat.txt"
+    r"D:\Download\tmp\jp.sunny.kanojo\files\bundleRes\bundle_file_list.dat"     # 加密的 .dat 会自动解密并缓存
 ]
 DEFAULT_SAVE_ROOT = r"D:\Download\tmp\jp.sunny.kanojo\files"
-DEFAULT_BASE_URL = "http://kanojo-jp-cdncf.y2sgames.com/kanojo-jp/1.0.1578/"    # 游戏更新后需要更新这个URL
+BASE_URL_TEMPLATE = "http://kanojo-jp-cdncf.y2sgames.com/kanojo-jp/{version}/"
+DEFAULT_VERSION = "1.0.1578"    # 游戏更新后改这里，或运行时用 --version 指定
+DEFAULT_BASE_URL = BASE_URL_TEMPLATE.format(version=DEFAULT_VERSION)
+
+# 连接池配置
+DEFAULT_WORKERS = 64
+DEFAULT_RETRIES = 3         # 连接失败 / 5xx 时的重试次数
+DEFAULT_BACKOFF = 0.5       # 重试间隔: 0.5s, 1s, 2s ...
+RETRY_STATUS = (429, 500, 502, 503, 504)
+DEFAULT_CONCURRENCY = 128   # asyncio 引擎的并发上限
+# 边下边还原的解密进程数；Windows 上进程池最多 61 个进程
+DEFAULT_DECRYPT_WORKERS = min(os.cpu_count() or 1, 61) if os.name == "nt" else os.cpu_count() or 1
+
+# 清单第一列是文件内容的哈希，按长度判断算法；下载中途保存在 .part 里，校验通过后再改名
+HASH_ALGOS = {32: "md5", 40: "sha1", 64: "sha256"}
+PART_SUFFIX = ".part"
+
+# 边下边还原：已下载但还没解密完的文件数上限 (背压)
+DEFAULT_QUEUE_SIZE = 256
+
+# 下载顺序：priority 先按 --priority 分组，再 hotRes 先于 bundleRes，同类里小文件优先；manifest 保持清单顺序
+ORDERS = ("priority", "manifest")
+TYPE_ORDER = {"hotres": 0, "bundleres": 1}
+RATE_UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+# 差分同步：上次同步成功的清单快照存在保存目录的 .manifest_cache 里 (还原脚本扫描时会跳过该目录)
+SYNC_SNAPSHOT_VERSION = 1
 # ===========================================
 
 def get_user_config():
@@ -34,6 +77,133 @@ def get_user_config():
 
     return manifest_files, save_root, DEFAULT_BASE_URL
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="超次元彼女 资源下载")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"下载线程数 (默认: {DEFAULT_WORKERS})")
+    parser.add_argument("--pool-size", type=int, default=None,
+                        help="HTTP 连接池大小 (默认: 与线程数相同)")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                        help=f"瞬时错误的重试次数 (默认: {DEFAULT_RETRIES})")
+    parser.add_argument("--engine", choices=("thread", "asyncio"), default="thread",
+                        help="下载引擎: thread (线程池) 或 asyncio (需要 aiohttp)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"asyncio 引擎同时进行的请求数 (默认: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--no-verify", action="store_true",
+                        help="不校验清单中的哈希 (只按大小判断)")
+    parser.add_argument("--restore-to", default=None, metavar="OUT",
+                        help="边下边还原：下载的数据直接解密还原到 OUT，不落地原始加密文件")
+    parser.add_argument("--keep-raw", action="store_true",
+                        help="边下边还原时仍保留原始加密文件")
+    parser.add_argument("--protector", action="append", default=None,
+                        help="边下边还原和 --priority 使用的 protector 列表 (可多次指定，默认同 restore_kanojo_final_v6)")
+    parser.add_argument("--bundle-list", default=None,
+                        help="边下边还原和 --priority 使用的 bundle list (默认同 restore_kanojo_final_v6)")
+    parser.add_argument("--decrypt-workers", type=int, default=DEFAULT_DECRYPT_WORKERS,
+                        help=f"边下边还原的解密进程数 (默认: CPU 核数，Windows 上最多 61，当前 {DEFAULT_DECRYPT_WORKERS})")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help=f"等待解密的文件数上限，满了下载线程会暂停 (默认: {DEFAULT_QUEUE_SIZE})")
+    parser.add_argument("--base-url", default=None,
+                        help="CDN 地址，可指向本地测试服务器 (默认: DEFAULT_BASE_URL)")
+    parser.add_argument("--version", default=None,
+                        help=f"游戏资源版本号，用来拼 CDN 地址 (默认: {DEFAULT_VERSION})")
+    parser.add_argument("--sync", action="store_true",
+                        help="差分同步：与上次同步的清单按哈希比较，只下载新增和变化的文件，不逐个检查本地文件")
+    parser.add_argument("--prune", action="store_true",
+                        help="配合 --sync：删除新清单里已经没有的本地文件")
+    parser.add_argument("--order", choices=ORDERS, default="priority",
+                        help="下载顺序: priority 优先组 -> hotRes -> bundleRes，同类小文件在前 (默认) / manifest 清单顺序")
+    parser.add_argument("--priority", action="append", default=None, metavar="PATTERN",
+                        help="优先下载的文件名模式，如 'spine_*'、'AVG_*'，按映射表里的真实文件名匹配 (可多次指定，先写的更优先；含 / 时匹配完整路径)")
+    parser.add_argument("--max-rate", default=None, metavar="RATE",
+                        help="全局限速 (字节/秒)，可带 K/M/G 后缀，如 5M (默认不限速)")
+    parser.add_argument("--per-host", type=int, default=0,
+                        help="每个主机同时进行的请求数上限 (默认: 0 不单独限制，即线程数 / 并发数)")
+    return parser.parse_args()
+
+def make_session(pool_size, retries=DEFAULT_RETRIES):
+    """所有线程共用一个 Session：连接池按线程数开，keep-alive 复用 TCP 连接"""
+    retry = Retry(total=retries, backoff_factor=DEFAULT_BACKOFF, status_forcelist=RETRY_STATUS,
+                  allowed_methods=frozenset(["GET"]), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# ================= 下载调度 =================
+def parse_rate(text):
+    """'500K' / '5M' / '1.5G' / '100000' -> 字节/秒"""
+    text = text.strip().upper().removesuffix("/S").removesuffix("B")
+    if text and text[-1] in RATE_UNITS:
+        return int(float(text[:-1]) * RATE_UNITS[text[-1]])
+    return int(text)
+
+def real_name_lookup(prots, bundle_list):
+    """
+    清单里的 hotRes 路径是 UUID，spine_* / AVG_* 这样的真实文件名只在 protector / bundle 映射里
+    返回 rel_path -> 真实文件名 (查不到时为 None)，探测顺序与还原脚本相同
+    """
+    import restore_kanojo_final_v6 as restore
+    names = {key: real_name for _, key, _, real_name in restore.iter_mapping_rows(prots, bundle_list)}
+    def lookup(rel_path):
+        for key in restore.probe_keys(rel_path):
+            if key in names: return names[key]
+        return None
+    return lookup
+
+def task_group(task, patterns, real_name=None):
+    """命中第几个 --priority 模式 (不区分大小写，优先用真实文件名)，都不命中排在最后"""
+    rel_path = task['rel_path'].replace("\\", "/")
+    path = ((real_name and real_name(rel_path)) or rel_path).replace("\\", "/").lower()
+    name = path.rsplit("/", 1)[-1]
+    for i, pattern in enumerate(patterns):
+        if fnmatch.fnmatchcase(path if "/" in pattern else name, pattern):
+            return i
+    return len(patterns)
+
+def schedule(tasks, patterns=(), real_name=None):
+    """
+    排好下载顺序：优先组 -> hotRes -> bundleRes，同一类里小文件在前，大小未知的放最后
+    线程池 / 协程都按提交顺序取任务，排在前面的文件先开始下载，
+    几千个小 hotRes 文件不会被一个大 bundle 挡在后面
+    """
+    patterns = [p.lower() for p in patterns]
+    def key(task):
+        top = task['rel_path'].replace("\\", "/").split("/", 1)[0].lower()
+        size = task['size'] if task['size'] > 0 else float("inf")
+        return (task_group(task, patterns, real_name), TYPE_ORDER.get(top, len(TYPE_ORDER)), size)
+    return sorted(tasks, key=key)
+
+class RateLimiter:
+    """全局限速 (令牌桶)：所有下载线程 / 协程共用，最多攒一秒的额度用于突发"""
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, n):
+        """记下 n 字节，返回调用方需要等待的秒数"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= n
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+RATE_LIMIT = None   # main 里按 --max-rate 设置
+
+def throttle(n):
+    if RATE_LIMIT:
+        wait = RATE_LIMIT.reserve(n)
+        if wait: time.sleep(wait)
+
+async def throttle_async(n):
+    if RATE_LIMIT:
+        wait = RATE_LIMIT.reserve(n)
+        if wait: await asyncio.sleep(wait)
+
 def parse_manifest(manifest_path, save_root_base):
     tasks = []
     if not os.path.exists(manifest_path):
@@ -46,53 +216,374 @@ def parse_manifest(manifest_path, save_root_base):
 
     print(f"读取清单: {filename} -> 目标: {sub_folder}")
     
-    with open(manifest_path, 'r', encoding='utf-8', errors='ignore') as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) >= 6:
-                file_hash = parts[0]
-                try: file_size = int(parts[1])
-                except: file_size = 0
+    for parts in load_manifest_rows(manifest_path):
+        if len(parts) >= 6:
+            file_hash = parts[0]
+            try: file_size = int(parts[1])
+            except: file_size = 0
                 
-                raw_path_str = parts[5]
-                target_rel_path = raw_path_str.split(',')[0]
-                full_rel_path = os.path.join(sub_folder, target_rel_path)
+            raw_path_str = parts[5]
+            target_rel_path = raw_path_str.split(',')[0]
+            full_rel_path = os.path.join(sub_folder, target_rel_path)
                 
-                tasks.append({
-                    'hash': file_hash,
-                    'size': file_size,
-                    'rel_path': full_rel_path,
-                    'save_root': save_root_base
-                })
+            tasks.append({
+                'hash': file_hash,
+                'size': file_size,
+                'rel_path': full_rel_path,
+                'save_root': save_root_base
+            })
     return tasks
 
-def download_file(task, base_url):
-    url = base_url + task['hash']
-    save_path = os.path.join(task['save_root'], task['rel_path'])
-    
+def is_downloaded(task, save_path):
+    # 差分同步认定内容已变的文件，大小相同也要重新下载
+    if task.get('force'): return False
     if os.path.exists(save_path):
         local_size = os.path.getsize(save_path)
         if task['size'] > 0 and local_size == task['size']:
-            return "skipped"
+            return True
         elif task['size'] <= 0 and local_size > 0:
-             return "skipped"
+            return True
+    return False
+
+def new_hasher(task, verify=True):
+    algo = HASH_ALGOS.get(len(task['hash'])) if verify else None
+    if algo is None: return None
+    try: int(task['hash'], 16)
+    except ValueError: return None
+    return hashlib.new(algo)
+
+def open_part(task, save_path, verify=True):
+    """
+    准备断点续传：返回 {'path', 'offset', 'hasher'}
+    已有的 .part 会先喂给 hasher，这样新数据边下边算，下载完不用再读一遍
+    """
+    part_path = save_path + PART_SUFFIX
+    hasher = new_hasher(task, verify)
+    offset = 0
+    if os.path.exists(part_path):
+        offset = os.path.getsize(part_path)
+        if task['size'] > 0 and offset > task['size']:
+            os.remove(part_path)
+            offset = 0
+        elif hasher and offset:
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    hasher.update(chunk)
+    return {'path': part_path, 'offset': offset, 'hasher': hasher}
+
+def range_headers(part):
+    return {'Range': f"bytes={part['offset']}-"} if part['offset'] else None
+
+def restart_part(part, task, verify=True):
+    """服务器不支持 Range (返回 200) 时从头下载"""
+    part['offset'] = 0
+    part['hasher'] = new_hasher(task, verify)
+
+def write_part(part, f, chunk):
+    f.write(chunk)
+    if part['hasher']: part['hasher'].update(chunk)
+    part['offset'] += len(chunk)
+
+def finish_part(part, task, save_path):
+    """检查大小和哈希，通过后原子改名为正式文件"""
+    if task['size'] > 0 and part['offset'] != task['size']:
+        # 短了就留着 .part 下次续传
+        return "error"
+    if part['hasher'] and part['hasher'].hexdigest() != task['hash'].lower():
+        os.remove(part['path'])
+        return "error"
+    os.replace(part['path'], save_path)
+    return "success"
+
+def download_file(task, base_url, session=None, verify=True):
+    url = base_url + task['hash']
+    save_path = os.path.join(task['save_root'], task['rel_path'])
+
+    if is_downloaded(task, save_path):
+        return "skipped"
 
     try:
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        resp = requests.get(url, stream=True, timeout=20)
-        if resp.status_code == 200:
-            with open(save_path, 'wb') as f:
-                for chunk in resp.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            return "success"
-        elif resp.status_code == 404:
-            return "404"
-        return "error"
+        part = open_part(task, save_path, verify)
+        # with 保证响应读完/关闭后连接回到池里
+        with (session or requests).get(url, headers=range_headers(part), stream=True, timeout=20) as resp:
+            if resp.status_code == 416 and part['offset']:
+                # .part 已经完整
+                return finish_part(part, task, save_path)
+            if resp.status_code in (200, 206):
+                if resp.status_code == 200: restart_part(part, task, verify)
+                with open(part['path'], 'ab' if part['offset'] else 'wb') as f:
+                    for chunk in resp.iter_content(chunk_size=65536):
+                        write_part(part, f, chunk)
+                        throttle(len(chunk))
+                return finish_part(part, task, save_path)
+            elif resp.status_code == 404:
+                return "404"
+            return "error"
     except:
         return "error"
 
+# ================= 差分同步 =================
+def snapshot_path(save_root, manifests):
+    """快照按清单文件名区分，换一组清单同步时不会把另一组的文件当成已删除"""
+    names = ",".join(sorted(os.path.basename(m).lower() for m in manifests))
+    tag = hashlib.sha1(names.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(save_root, CACHE_DIR_NAME, f"hotres_sync.{tag}.v{SYNC_SNAPSHOT_VERSION}.snapshot")
+
+def load_snapshot(path):
+    """返回 {'version', 'entries': {rel_path: (hash, size)}, 'stale': {...}}，没有或损坏时返回 None"""
+    try:
+        with open(path, "rb") as f:
+            snap = marshal.load(f)
+        return snap if isinstance(snap, dict) and 'entries' in snap else None
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
+
+def save_snapshot(path, snap):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        marshal.dump(snap, f, 4)
+    os.replace(tmp_path, path)
+
+def diff_manifest(old_entries, tasks):
+    """
+    按哈希比较新旧清单，只返回新增 / 变化的任务 (变化的标记 force)，以及新清单里已经没有的 rel_path
+    没变的文件连 stat 都不做
+    """
+    changed, added = [], []
+    current = set()
+    for task in tasks:
+        current.add(task['rel_path'])
+        old = old_entries.get(task['rel_path'])
+        if old is None:
+            added.append(task)
+        elif old[0] != task['hash']:
+            task['force'] = True
+            changed.append(task)
+    removed = [p for p in old_entries if p not in current]
+    return added, changed, removed
+
+def prune_files(save_root, rel_paths):
+    """删除本地文件和残留的 .part，返回实际删除的文件数"""
+    pruned = 0
+    for rel_path in rel_paths:
+        save_path = os.path.join(save_root, rel_path)
+        for path in (save_path, save_path + PART_SUFFIX):
+            try:
+                os.remove(path)
+                pruned += 1
+            except OSError:
+                pass
+    return pruned
+
+def next_snapshot(old, version, tasks, fetched, results, removed, pruned):
+    """
+    新快照 = 新清单里没变的条目 + 本次下载成功 / 已存在的条目
+    下载失败的变化文件保留旧哈希，下次同步还会重试；未清理的已删除文件记在 stale 里，以后 --prune 还能删
+    """
+    entries = {t['rel_path']: (t['hash'], t['size']) for t in tasks}
+    old_entries = old['entries'] if old else {}
+    for task, result in zip(fetched, results):
+        if result not in ("success", "skipped"):
+            prev = old_entries.get(task['rel_path'])
+            # 同一路径在清单里出现多次时可能已经删过
+            if prev is None: entries.pop(task['rel_path'], None)
+            else: entries[task['rel_path']] = prev
+    stale = dict(old.get('stale', {})) if old and not pruned else {}
+    if not pruned:
+        stale.update((p, old_entries[p]) for p in removed)
+    for p in entries: stale.pop(p, None)
+    return {'version': version, 'entries': entries, 'stale': stale}
+
+# ================= asyncio 引擎 =================
+async def download_file_async(task, base_url, session, retries, verify=True):
+    url = base_url + task['hash']
+    save_path = os.path.join(task['save_root'], task['rel_path'])
+
+    try:
+        if is_downloaded(task, save_path):
+            return "skipped"
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    except Exception:
+        # 与线程引擎一样，单个文件的本地错误只算失败，不中断整个 gather
+        return "error"
+
+    for attempt in range(retries + 1):
+        if attempt:
+            await asyncio.sleep(DEFAULT_BACKOFF * (2 ** (attempt - 1)))
+        try:
+            # 每次重试都从 .part 的当前位置续传
+            part = open_part(task, save_path, verify)
+            async with session.get(url, headers=range_headers(part)) as resp:
+                if resp.status == 416 and part['offset']:
+                    return finish_part(part, task, save_path)
+                if resp.status in (200, 206):
+                    if resp.status == 200: restart_part(part, task, verify)
+                    with open(part['path'], 'ab' if part['offset'] else 'wb') as f:
+                        async for chunk in resp.content.iter_chunked(65536):
+                            write_part(part, f, chunk)
+                            await throttle_async(len(chunk))
+                    return finish_part(part, task, save_path)
+                elif resp.status == 404:
+                    return "404"
+                elif resp.status not in RETRY_STATUS:
+                    return "error"
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        except Exception:
+            return "error"
+    return "error"
+
+async def run_asyncio(tasks, base_url, concurrency, retries, verify=True, per_host=0):
+    """
+    固定 concurrency 个协程从同一个迭代器取任务，
+    不会像线程池那样一次性为 5 万个文件各建一个 future
+    """
+    results = [None] * len(tasks)
+    task_iter = enumerate(tasks)
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host)
+    timeout = aiohttp.ClientTimeout(sock_connect=20, sock_read=20)
+    with tqdm(total=len(tasks), unit="file", ncols=80) as pbar:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            async def worker():
+                for i, task in task_iter:
+                    results[i] = await download_file_async(task, base_url, session, retries, verify)
+                    pbar.update(1)
+            await asyncio.gather(*(worker() for _ in range(min(concurrency, len(tasks)))))
+    return results
+
+def run_threads(tasks, base_url, workers, pool_size, retries, verify=True):
+    with make_session(pool_size, retries) as session:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(download_file, task, base_url, session, verify) for task in tasks]
+            for _ in tqdm(concurrent.futures.as_completed(futures), total=len(tasks), unit="file", ncols=80): pass
+            # 按任务顺序返回，差分同步要知道每个文件的结果
+            return [f.result() for f in futures]
+
+# ================= 边下边还原 =================
+def fetch_bytes(task, base_url, session, verify=True):
+    """下载到内存并校验，返回 (结果, 数据)"""
+    url = base_url + task['hash']
+    try:
+        with session.get(url, stream=True, timeout=20) as resp:
+            if resp.status_code == 200:
+                hasher = new_hasher(task, verify)
+                data = bytearray()
+                for chunk in resp.iter_content(chunk_size=65536):
+                    data += chunk
+                    if hasher: hasher.update(chunk)
+                    throttle(len(chunk))
+                if task['size'] > 0 and len(data) != task['size']:
+                    return "error", None
+                if hasher and hasher.hexdigest() != task['hash'].lower():
+                    return "error", None
+                return "success", data
+            elif resp.status_code == 404:
+                return "404", None
+            return "error", None
+    except:
+        return "error", None
+
+def save_raw(data, save_path):
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    part_path = save_path + PART_SUFFIX
+    with open(part_path, 'wb') as f:
+        f.write(data)
+    os.replace(part_path, save_path)
+
+def run_pipeline(tasks, base_url, workers, pool_size, retries, verify, mapping, out, keep_raw, decrypt_workers, queue_size):
+    """
+    网络线程下载到内存 -> 进程池解密还原 -> 只写还原后的文件
+    在途任务数由信号量限制，解密跟不上时下载线程会阻塞等待
+    已经存在于本地的原始文件不再下载，直接从磁盘还原
+    """
+    import restore_kanojo_final_v6 as restore
+
+    inflight = threading.BoundedSemaphore(queue_size)
+    restored = Counter()
+    lock = threading.Lock()
+
+    def on_restored(fut):
+        inflight.release()
+        ok = fut.exception() is None and fut.result() is not None
+        with lock: restored['ok' if ok else 'error'] += 1
+
+    with make_session(pool_size, retries) as session, \
+         concurrent.futures.ProcessPoolExecutor(max_workers=restore.clamp_workers(decrypt_workers),
+                                                initializer=restore._init_worker,
+                                                initargs=(mapping, tasks[0]['save_root'], out)) as pool, \
+         concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def stage(task):
+            # 与 download_file 一样，单个文件出错只算失败，不让异常经 f.result() 中断整个运行
+            try:
+                save_path = os.path.join(task['save_root'], task['rel_path'])
+                if is_downloaded(task, save_path):
+                    result, job = "skipped", (restore._restore_file_task, save_path)
+                else:
+                    result, data = fetch_bytes(task, base_url, session, verify)
+                    if result != "success": return result
+                    if keep_raw: save_raw(data, save_path)
+                    job = (restore._restore_bytes_task, data, task['rel_path'])
+            except Exception:
+                return "error"
+            inflight.acquire()
+            try:
+                pool.submit(*job).add_done_callback(on_restored)
+            except Exception:
+                # 进程池已损坏 (BrokenProcessPool) 等：交还名额，记为还原失败
+                inflight.release()
+                with lock: restored['error'] += 1
+                return "error"
+            return result
+
+        futures = [executor.submit(stage, task) for task in tasks]
+        for _ in tqdm(concurrent.futures.as_completed(futures), total=len(tasks), unit="file", ncols=80): pass
+        results = [f.result() for f in futures]
+        print("等待解密队列清空...")
+
+    print(f"还原成功: {restored['ok']}  还原失败: {restored['error']}")
+    return results
+
+def run_downloads(tasks, base_url, args):
+    """按参数选择引擎下载 tasks，返回与 tasks 一一对应的结果；缺少依赖时返回 None"""
+    # 线程引擎的连接池本身按主机分池且满了会阻塞，池大小就是单主机并发上限
+    per_host = max(0, args.per_host)
+    if args.restore_to:
+        import restore_kanojo_final_v6 as restore
+        prots = args.protector or restore.DEFAULT_PROTECTORS
+        mapping = restore.load_mappings(prots, args.bundle_list or restore.DEFAULT_BUNDLE_LIST,
+                                        os.path.join(args.restore_to, restore.DEFAULT_MAPPING_CACHE))
+        workers = max(1, args.workers)
+        pool_size = max(1, args.pool_size or workers)
+        if per_host: pool_size = min(pool_size, per_host)
+        print(f"开始边下边还原... (下载线程: {workers}, 解密进程: {args.decrypt_workers}) -> {args.restore_to}")
+        return run_pipeline(tasks, base_url, workers, pool_size, args.retries, not args.no_verify, mapping,
+                            args.restore_to, args.keep_raw, max(1, args.decrypt_workers), max(1, args.queue_size))
+    elif args.engine == "asyncio":
+        if aiohttp is None:
+            print("asyncio 引擎需要 aiohttp 库: pip install aiohttp")
+            return None
+        concurrency = max(1, args.concurrency)
+        print(f"开始下载... (asyncio, 并发: {concurrency})")
+        return asyncio.run(run_asyncio(tasks, base_url, concurrency, args.retries, not args.no_verify, per_host))
+    else:
+        workers = max(1, args.workers)
+        pool_size = max(1, args.pool_size or workers)
+        if per_host: pool_size = min(pool_size, per_host)
+        print(f"开始下载... (线程数: {workers}, 连接池: {pool_size})")
+        return run_threads(tasks, base_url, workers, pool_size, args.retries, not args.no_verify)
+
 def main():
+    global RATE_LIMIT
+    args = parse_args()
     manifests, save_root, base_url = get_user_config()
+    version = args.version or DEFAULT_VERSION
+    if args.version:
+        base_url = BASE_URL_TEMPLATE.format(version=args.version)
+    if args.base_url:
+        base_url = args.base_url if args.base_url.endswith("/") else args.base_url + "/"
     
     all_tasks = []
     for m in manifests:
@@ -102,11 +593,49 @@ def main():
     print(f"\n共 {total} 个文件待处理。")
     if total == 0: return
 
-    print("开始下载...")
-    # 这里使用偏函数或者lambda传递 base_url
-    with concurrent.futures.ThreadPoolExecutor(max_workers=64) as executor:
-        futures = [executor.submit(download_file, task, base_url) for task in all_tasks]
-        results = [f.result() for f in tqdm(concurrent.futures.as_completed(futures), total=total, unit="file", ncols=80)]
+    fetch_tasks, snap, removed = all_tasks, None, []
+    if args.sync:
+        snap_file = snapshot_path(save_root, manifests)
+        snap = load_snapshot(snap_file)
+        if snap is None:
+            print("没有上次同步的快照，本次逐个检查本地文件 (全量)")
+        else:
+            added, changed, removed = diff_manifest(snap['entries'], all_tasks)
+            fetch_tasks = added + changed
+            print(f"版本 {snap['version']} -> {version}: 新增 {len(added)}  变化 {len(changed)}  "
+                  f"删除 {len(removed)}  未变 {total - len(fetch_tasks)}")
+            if args.prune:
+                current = {t['rel_path'] for t in all_tasks}
+                stale = removed + [p for p in snap['stale'] if p not in current]
+                print(f"已清理 {prune_files(save_root, stale)} 个本地文件")
+    elif args.prune:
+        print("[提示] --prune 需要配合 --sync 使用")
+
+    if args.order == "priority":
+        real_name = None
+        if args.priority:
+            import restore_kanojo_final_v6 as restore
+            real_name = real_name_lookup(args.protector or restore.DEFAULT_PROTECTORS,
+                                         args.bundle_list or restore.DEFAULT_BUNDLE_LIST)
+            print(f"优先下载: {', '.join(args.priority)}")
+        fetch_tasks = schedule(fetch_tasks, args.priority or (), real_name)
+    if args.max_rate:
+        RATE_LIMIT = RateLimiter(parse_rate(args.max_rate))
+        print(f"全局限速: {args.max_rate}/s")
+
+    if fetch_tasks:
+        results = run_downloads(fetch_tasks, base_url, args)
+        if results is None: return
+    else:
+        print("没有需要下载的文件")
+        results = []
+
+    if args.sync:
+        save_snapshot(snap_file, next_snapshot(snap, version, all_tasks, fetch_tasks, results, removed,
+                                               args.prune and snap is not None))
+
+    counts = Counter(results)
+    print(f"\n成功: {counts['success']}  跳过: {counts['skipped']}  404: {counts['404']}  失败: {counts['error']}")
 
     print(f"\n下载完成！保存位置: {save_root}")
     input("按回车键退出...")
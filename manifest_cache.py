@@ -0,0 +1,77 @@
+import os
+import re
+import glob
+import hashlib
+import zlib
+import xxtea
+
+from auxiliary_decrypt import KEY, HEADER_BYTES
+
+# 加密清单解出的明文缓存在清单旁边的 .manifest_cache 目录，文件名带上原文件内容的 sha1
+# 只缓存明文、不缓存拆分后的行：几十万个小 list 反序列化比重新 split 还慢
+CACHE_DIR_NAME = ".manifest_cache"
+CACHE_VERSION = 2
+
+def is_encrypted(raw):
+    header_len = len(HEADER_BYTES)
+    return len(raw) > header_len and raw[:header_len] == HEADER_BYTES
+
+def decrypt_manifest(enc):
+    """解密 protector.dat / bundle_file_list.dat 等清单，未加密的原样返回"""
+    header_len = len(HEADER_BYTES)
+    if not is_encrypted(enc):
+        return enc
+    n = len(enc) - header_len
+    buf = bytearray(n + (4 - n % 4) % 4)
+    buf[:n] = memoryview(enc)[header_len:]
+    dec = xxtea.decrypt(buf, KEY, padding=False)
+    return zlib.decompress(memoryview(dec)[1:])
+
+def parse_rows(text_bytes):
+    text = text_bytes.decode('utf-8', errors='ignore')
+    return [parts for parts in (line.split() for line in text.splitlines()) if parts]
+
+def cache_path_for(manifest_path, digest):
+    base = os.path.basename(manifest_path)
+    return os.path.join(os.path.dirname(os.path.abspath(manifest_path)), CACHE_DIR_NAME,
+                        f"{base}.{digest}.v{CACHE_VERSION}.txt")
+
+def remove_stale_caches(manifest_path, keep):
+    """清掉同一清单的旧缓存 (包括旧版本的 .rows)；只删 <清单名>.<sha1>.v<N>.* 形式的文件，不误删同名前缀的其他清单"""
+    cache_dir = os.path.dirname(keep)
+    base = os.path.basename(manifest_path)
+    own = re.compile(re.escape(base) + r"\.[0-9a-f]{40}\.v\d+\.(rows|txt)")
+    for old in glob.glob(os.path.join(glob.escape(cache_dir), glob.escape(base) + ".*")):
+        if old != keep and own.fullmatch(os.path.basename(old)):
+            os.remove(old)
+
+def load_manifest_rows(manifest_path):
+    """
+    读取清单并返回按空白拆分后的行 [[字段, ...], ...]
+    可以直接传加密的 .dat，也可以传 auxiliary_decrypt.py 解出的 .txt
+    明文清单直接解析；加密清单解出的明文按文件内容哈希缓存，清单没变时省掉 XXTEA + zlib
+    """
+    with open(manifest_path, "rb") as f:
+        raw = f.read()
+    if not is_encrypted(raw):
+        return parse_rows(raw)
+
+    digest = hashlib.sha1(raw).hexdigest()
+    cache_path = cache_path_for(manifest_path, digest)
+    try:
+        with open(cache_path, "rb") as f:
+            return parse_rows(f.read())
+    except OSError:
+        pass
+
+    text = decrypt_manifest(raw)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        remove_stale_caches(manifest_path, cache_path)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(text)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    return parse_rows(text)
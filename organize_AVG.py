@@ -1,8 +1,9 @@
 import os
-import shutil
 import json
 import re
 
+from restored_pack import open_pack_from_argv, list_source_files, take_file
+
 def get_config_content(model_id, variant_type):
     """
     根据变体类型（1 或 2）生成对应的 JSON 配置内容
@@ -79,7 +80,10 @@ def get_config_content(model_id, variant_type):
 
 def organize_files():
     current_dir = os.getcwd()
-    files = [f for f in os.listdir(current_dir) if os.path.isfile(os.path.join(current_dir, f))]
+    # 可选参数为还原包 (restore_kanojo_final_v6.py --pack)，此时从包里解出而不是移动散文件
+    pack = open_pack_from_argv()
+    files = list_source_files(current_dir, pack)
+    file_set = set(files)
     
     # 1. 扫描所有唯一的 ID (例如 8026)
     # 匹配 AVG_XXXX_Y
@@ -115,7 +119,7 @@ def organize_files():
             temp_files = []
             for ext in required_exts:
                 fname = base_name + ext
-                if os.path.exists(os.path.join(current_dir, fname)):
+                if fname in file_set:
                     temp_files.append(fname)
                 else:
                     is_complete = False
@@ -148,10 +152,9 @@ def organize_files():
         
         # 2. 移动文件
         for fname in files_to_move:
-            src = os.path.join(current_dir, fname)
             dst = os.path.join(target_folder_path, fname)
             try:
-                shutil.move(src, dst)
+                take_file(current_dir, fname, dst, pack)
             except Exception as e:
                 print(f"  移动 {fname} 失败: {e}")
 
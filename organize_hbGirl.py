@@ -1,14 +1,18 @@
 import os
-import shutil
 import json
 import re
 
+from restored_pack import open_pack_from_argv, list_source_files, take_file
+
 def organize_files():
     # 获取当前脚本所在的目录
     current_dir = os.getcwd()
+    # 可选参数为还原包 (restore_kanojo_final_v6.py --pack)，此时从包里解出而不是移动散文件
+    pack = open_pack_from_argv()
     
     # 扫描目录下所有的文件
-    files = [f for f in os.listdir(current_dir) if os.path.isfile(os.path.join(current_dir, f))]
+    files = list_source_files(current_dir, pack)
+    file_set = set(files)
     
     # 用于存储找到的基础名称 (例如: hbGirl_1001)
     basenames = set()
@@ -41,13 +45,12 @@ def organize_files():
         extensions = ['.png', '.atlas', '.json']
         for ext in extensions:
             file_name = f"{base_name}{ext}"
-            src_path = os.path.join(current_dir, file_name)
             dst_path = os.path.join(target_folder, file_name)
             
             # 只有当源文件存在时才移动
-            if os.path.exists(src_path):
+            if file_name in file_set:
                 # 如果目标文件夹里已经有这个文件，先覆盖或跳过，这里选择移动并覆盖
-                shutil.move(src_path, dst_path)
+                take_file(current_dir, file_name, dst_path, pack)
                 print(f"  - 已移动: {file_name}")
         
         # 3. 生成 config.json 文件
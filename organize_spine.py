@@ -1,13 +1,16 @@
 import os
-import shutil
 import re
 import json
 
+from restored_pack import open_pack_from_argv, list_source_files, take_file
+
 def organize_spine_files():
     # 获取当前工作目录
     current_dir = os.getcwd()
+    # 可选参数为还原包 (restore_kanojo_final_v6.py --pack)，此时从包里解出而不是移动散文件
+    pack = open_pack_from_argv()
     # 扫描所有文件
-    all_files = [f for f in os.listdir(current_dir) if os.path.isfile(os.path.join(current_dir, f))]
+    all_files = list_source_files(current_dir, pack)
 
     # 1. 提取所有 spine ID
     spine_ids = set()
@@ -56,15 +59,13 @@ def organize_spine_files():
 
         # 移动核心文件
         for f_name in core_files.values():
-            src = os.path.join(current_dir, f_name)
             dst = os.path.join(target_folder, f_name)
-            shutil.move(src, dst)
+            take_file(current_dir, f_name, dst, pack)
 
         # 移动 MP3 文件
         for mp3 in related_mp3s:
-            src = os.path.join(current_dir, mp3)
             dst = os.path.join(target_folder, mp3)
-            shutil.move(src, dst)
+            take_file(current_dir, mp3, dst, pack)
 
         # 4. 生成 config.json
         generate_config(target_folder, spine_id, related_mp3s)
@@ -1,28 +1,141 @@
 import os
+import sys
+import mmap
+import marshal
 import zlib
 import xxtea
 import zipfile
 import io
+import re
+import shutil
+import tempfile
+import hashlib
+import itertools
+import time
+import json
+import csv
+import contextlib
+from collections import Counter
+import argparse
+import queue
+import sqlite3
+import threading
+import concurrent.futures
 from tqdm import tqdm
 
+from manifest_cache import load_manifest_rows, CACHE_DIR_NAME
+from restored_pack import PackWriter
+
 # ================= 默认配置 =================
 DEFAULT_SOURCE = r"D:\Download\tmp\jp.sunny.kanojo\files"
 DEFAULT_OUTPUT = r"D:\Download\tmp\jp.sunny.kanojo\files\Restored_Assets"
 
 # 这里预设了常用的映射表路径，根据实际情况修改
 # 多个protector，把它们的路径都写在这里，或者在终端输入
+# 可以直接填加密的 .dat (自动解密并缓存)，也可以填 auxiliary_decrypt.py 解出的 decrypted_xxx.dat.txt
 DEFAULT_PROTECTORS = [
-    r"D:\Download\tmp\jp.sunny.kanojo\files\hotRes\decrypted_protector.dat.txt",
-    r"D:\Download\tmp\jp.sunny.kanojo\files\hotRes\decrypted_login_protector.dat.txt"
+    r"D:\Download\tmp\jp.sunny.kanojo\files\hotRes\protector.dat",
+    r"D:\Download\tmp\jp.sunny.kanojo\files\hotRes\login_protector.dat"
     # 如果有其他的 protector，继续往下列加
 ]
-DEFAULT_BUNDLE_LIST = r"D:\Download\tmp\jp.sunny.kanojo\files\bundleRes\decrypted_bundle_file_list.dat.txt"
+DEFAULT_BUNDLE_LIST = r"D:\Download\tmp\jp.sunny.kanojo\files\bundleRes\bundle_file_list.dat"
 
 # 密钥配置
 KEY = b"\x24\xfa\x49\x9b\x10\x8d\x62\x59\x29\x26\x81\x67\x4b\xf7\x91\xeb"
 HEADER_BYTES = b"\x0c\x07\x08\x0d\x0b\x09"
+
+# 并行配置 (--workers 1 即为原来的单核串行模式)
+# Windows 上 ProcessPoolExecutor 最多 61 个进程，超过直接报 ValueError (64 线程的机器默认值就会超)
+MAX_PROCESS_WORKERS = 61 if os.name == "nt" else None
+
+def clamp_workers(n):
+    return min(n, MAX_PROCESS_WORKERS) if MAX_PROCESS_WORKERS else n
+
+DEFAULT_WORKERS = clamp_workers(os.cpu_count() or 1)
+DEFAULT_CHUNK_SIZE = 64     # 每个任务包含的文件数，越大 IPC 开销越小
+
+# --engine thread：读 / 解码 / 写 三段线程流水线，适合网络盘等 I/O 延迟大的场景
+ENGINES = ("process", "thread")
+DEFAULT_READERS = 8
+DEFAULT_DECODERS = os.cpu_count() or 1
+DEFAULT_WRITERS = 4
+DEFAULT_QUEUE_SIZE = 64     # 每段之间队列的容量 (文件数)
+PREFETCH_MAX = 16 << 20     # 超过此大小的文件不整份预读，交给解码线程流式处理
+
+# --profile：cProfile 为标准库；pyinstrument 需要另外安装
+PROFILERS = ("cprofile", "pyinstrument")
+PROFILE_NAME = "restore_profile"
+
+# 源目录扫描：多线程 scandir，扫到的文件按目录成批交给还原引擎
+DEFAULT_SCAN_WORKERS = 8
+SCAN_QUEUE_SIZE = 64        # 扫描结果队列容量 (批数)，还原跟不上时扫描自然暂停
+
+# 输出文件的落盘策略: none 交给系统 / file 每个文件关闭前 fsync / end 全部写完后 sync 一次
+FSYNC_MODES = ("none", "file", "end")
+WRITE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+
+# 增量还原：状态库默认放在输出目录下
+DEFAULT_STATE_DB = ".restore_state.sqlite"
+
+# 映射表二进制缓存 (默认放在输出目录下，映射表文件变化后自动重建)
+DEFAULT_MAPPING_CACHE = ".mapping_cache.bin"
+MAPPING_CACHE_MAGIC = b"KMAP2\n"
+
+# 流式解码时每次喂给 zlib / 写盘的块大小
+STREAM_CHUNK = 1 << 20
+
+# 去重：内容哈希登记在输出目录的 .dedupe 下
+DEDUPE_DIR = ".dedupe"
+DEDUPE_INDEX = "index.tsv"     # --dedupe index 时记录 重复文件 -> 原文件
+DEDUPE_MODES = ("hardlink", "reflink", "index")
+FICLONE = 0x40049409           # Linux ioctl，btrfs/xfs 等支持写时复制的文件系统可用
+
+# 嵌套 ZIP 限制：层数、单个源文件解压总量 (防 ZIP 炸弹)、内层 ZIP 暂存在内存的上限
+ZIP_MAX_DEPTH = 8
+ZIP_MAX_BYTES = 4 << 30
+ZIP_SPOOL_MAX = 64 << 20
 # ===========================================
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="超次元彼女 资源全量还原 V6")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"并行进程数 (默认: {DEFAULT_WORKERS}，1 为串行)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"每批提交给进程池的文件数 (默认: {DEFAULT_CHUNK_SIZE})")
+    parser.add_argument("--engine", choices=ENGINES, default="process",
+                        help="process: 多进程 (默认，适合本地盘) / thread: 读-解码-写 线程流水线 (适合 NFS 等高延迟存储)")
+    parser.add_argument("--readers", type=int, default=DEFAULT_READERS,
+                        help=f"thread 引擎的读文件线程数 (默认: {DEFAULT_READERS})")
+    parser.add_argument("--decoders", type=int, default=DEFAULT_DECODERS,
+                        help=f"thread 引擎的解码线程数 (默认: {DEFAULT_DECODERS})")
+    parser.add_argument("--writers", type=int, default=DEFAULT_WRITERS,
+                        help=f"thread 引擎的写文件线程数 (默认: {DEFAULT_WRITERS})")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help=f"thread 引擎每段之间的队列容量 (默认: {DEFAULT_QUEUE_SIZE})")
+    parser.add_argument("--scan-workers", type=int, default=DEFAULT_SCAN_WORKERS,
+                        help=f"扫描源目录的线程数 (默认: {DEFAULT_SCAN_WORKERS})")
+    parser.add_argument("--report", default=None, metavar="PATH",
+                        help="运行结束后写出统计报告 (.json 或 .csv)：各阶段耗时、字节数、映射探测命中数、错误分类")
+    parser.add_argument("--profile", choices=PROFILERS, default=None,
+                        help="对还原过程做性能剖析，结果写到输出目录 (只覆盖主进程，建议配合 --workers 1 或 --engine thread)")
+    parser.add_argument("--analyze", default=None, metavar="PATH",
+                        help="只做映射覆盖率分析，不还原：覆盖冲突、磁盘上缺失的条目、未映射文件按目录汇总，明细写到 PATH (.json)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量还原：跳过大小和修改时间都没变的已还原文件")
+    parser.add_argument("--state-db", default=None,
+                        help=f"增量状态库路径 (默认: 输出目录/{DEFAULT_STATE_DB}，--pack 时为 <包路径>{DEFAULT_STATE_DB})")
+    parser.add_argument("--dedupe", choices=DEDUPE_MODES, default=None,
+                        help="内容相同的输出只保留一份: hardlink 硬链接 / reflink 写时复制 / index 只记录到 .dedupe/index.tsv")
+    parser.add_argument("--fsync", choices=FSYNC_MODES, default="none",
+                        help="落盘策略: none 交给系统 (默认，最快) / file 每个文件 fsync / end 全部完成后统一 sync")
+    parser.add_argument("--pack", default=None, metavar="PATH",
+                        help="还原结果写进一个不压缩的 ZIP 包 (PATH)，而不是散文件；organize 脚本可直接读取该包")
+    parser.add_argument("--zip-all", action="store_true",
+                        help="ZIP 包解出全部成员 (默认只还原第一个)，其余成员放在 <还原文件名>/ 目录下")
+    parser.add_argument("--link-raw", action="store_true",
+                        help="未加密的原始文件直接硬链接到源文件 (需在同一文件系统，否则退回复制；改动输出会影响源文件)")
+    return parser.parse_args()
+
 def get_user_config():
     print("=== 全量智能还原配置 V6 (通用扫描版) ===")
     print(f"\n[1] 原始资源目录 (Source) - 请指向从手机复制出来的 files 目录:")
@@ -43,25 +156,246 @@ def get_user_config():
 
     return src, out, prot_list, bun_list
 
-def load_mappings(prot_list, bundle_list):
-    mapping = {}
-    print("\n正在加载映射表 (自动合并多个 Protector)...")
+# ================= 运行统计 (--report) =================
+PROBE_NAMES = ("probe_strip_dir", "probe_full_path", "probe_no_ext")
+NO_TIMER = contextlib.nullcontext()
+STATS = None     # 未开启 --report 时为 None，所有统计点都只多一次判断
+
+class _StageTimer:
+    __slots__ = ("stats", "stage", "t0")
+
+    def __init__(self, stats, stage):
+        self.stats, self.stage = stats, stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.stats.add_time(self.stage, time.perf_counter() - self.t0)
+
+class RunStats:
+    """
+    各阶段累计耗时 / 次数、字节数、三种映射探测的命中数、错误分类
+    同一进程内的线程共用一份 (加锁)；多进程时每个 worker 一份，每批任务回传后在主进程合并
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seconds, self.calls, self.counts, self.errors = Counter(), Counter(), Counter(), Counter()
+        self.examples = {}
+
+    def timer(self, stage):
+        return _StageTimer(self, stage)
+
+    def add_time(self, stage, seconds):
+        with self.lock:
+            self.seconds[stage] += seconds
+            self.calls[stage] += 1
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] += n
+
+    def error(self, e, path):
+        category = type(e).__name__
+        with self.lock:
+            self.errors[category] += 1
+            self.examples.setdefault(category, f"{os.path.basename(path)}: {e}")
+
+    def take(self):
+        """取出当前统计并清空 (worker 每批任务回传一次)"""
+        with self.lock:
+            snap = (dict(self.seconds), dict(self.calls), dict(self.counts), dict(self.errors), dict(self.examples))
+            for c in (self.seconds, self.calls, self.counts, self.errors): c.clear()
+            self.examples.clear()
+        return snap
 
+    def merge(self, snap):
+        seconds, calls, counts, errors, examples = snap
+        with self.lock:
+            self.seconds.update(seconds)
+            self.calls.update(calls)
+            self.counts.update(counts)
+            self.errors.update(errors)
+            for k, v in examples.items(): self.examples.setdefault(k, v)
+
+    def rows(self):
+        """(分类, 名称, 次数, 秒数, 示例) 形式的明细，CSV 和 JSON 共用"""
+        rows = [("stage", name, self.calls[name], round(sec, 6), "") for name, sec in sorted(self.seconds.items())]
+        rows += [("counter", name, n, "", "") for name, n in sorted(self.counts.items())]
+        rows += [("error", name, n, "", self.examples.get(name, "")) for name, n in self.errors.most_common()]
+        return rows
+
+    def write(self, path, elapsed):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        rows = [("run", "wall_time", "", round(elapsed, 6), "")] + self.rows()
+        if path.lower().endswith(".csv"):
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(("kind", "name", "count", "seconds", "example"))
+                writer.writerows(rows)
+        else:
+            report = {"wall_time": round(elapsed, 6), "stages": {}, "counters": dict(self.counts), "errors": {}}
+            for kind, name, n, sec, example in rows:
+                if kind == "stage": report["stages"][name] = {"calls": n, "seconds": sec}
+                elif kind == "error": report["errors"][name] = {"count": n, "example": example}
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+
+def stage(name):
+    """with stage("xxtea"): ...  未开启统计时是空操作"""
+    return STATS.timer(name) if STATS is not None else NO_TIMER
+
+def count(name, n=1):
+    if STATS is not None: STATS.count(name, n)
+
+def report_error(e, path):
+    """打印错误 (Bad zip 与旧版一样不打印)，开启统计时按异常类型计数，Bad zip 也计入"""
+    if STATS is not None: STATS.error(e, path)
+    if "Bad zip" not in str(e): tqdm.write(f"[Error] {os.path.basename(path)}: {e}")
+
+def lookup_counted(mapping, rel_path):
+    """mapping.lookup；开启统计时另外记下是三种探测中的哪一种命中的"""
+    if STATS is None: return mapping.lookup(rel_path)
+    with STATS.timer("lookup"):
+        idx = mapping.lookup(rel_path)
+    if idx < 0:
+        STATS.count("probe_miss")
+    else:
+        for name, key in zip(PROBE_NAMES, probe_keys(rel_path)):
+            if mapping.keys.get(key) == idx:
+                STATS.count(name)
+                break
+    return idx
+
+# ================= 映射表 =================
+def probe_keys(rel_path):
+    """decrypt_and_save 依次尝试的三个 Key：去掉第一层目录 / 完整相对路径 / 去掉后缀"""
+    parts = rel_path.split("/", 1)
+    lookup_key = parts[1].lower() if len(parts) > 1 else rel_path.lower()
+    return (lookup_key, rel_path.lower(), os.path.splitext(lookup_key)[0])
+
+class NameRegistry:
+    """
+    扁平化目录的重名登记：同名文件依次分配 name, name_2, name_3 ...
+    每个文件名记住下一个候选序号，不用再一个个 os.path.exists 试探
+    按小写登记，Windows 下大小写不同的文件名也不会互相覆盖
+    """
+    __slots__ = ('taken', 'next_suffix')
+
+    def __init__(self):
+        self.taken = set()
+        self.next_suffix = {}
+
+    def claim(self, filename):
+        if filename.lower() not in self.taken:
+            self.taken.add(filename.lower())
+            return filename
+        name, ext = os.path.splitext(filename)
+        counter = self.next_suffix.get(filename.lower(), 2)
+        while True:
+            candidate = f"{name}_{counter}{ext}"
+            counter += 1
+            if candidate.lower() not in self.taken: break
+        self.next_suffix[filename.lower()] = counter
+        self.taken.add(candidate.lower())
+        return candidate
+
+class MappingIndex:
+    """
+    紧凑映射表：Key -> 条目编号，条目数据放在并列数组里 (类型 / 真实文件名)
+    不再为每条记录建一个小 dict；重复的文件名 (如 1.png) 只保留一个 str 对象
+    flat_names 是 protector 条目在扁平化 hotRes 目录里的最终文件名 (已处理重名)
+    """
+    __slots__ = ('keys', 'types', 'names', 'flat_names')
+    BUNDLE, PROTECTOR = 0, 1
+
+    def __init__(self, keys=None, types=None, names=None, flat_names=None):
+        self.keys = keys if keys is not None else {}
+        self.types = types if types is not None else bytearray()
+        self.names = names if names is not None else []
+        self.flat_names = flat_names if flat_names is not None else []
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, key, entry_type, real_name):
+        # 后加入的覆盖先加入的 (protector 覆盖 bundle)，编号不变
+        key, real_name = sys.intern(key), sys.intern(real_name)
+        idx = self.keys.get(key)
+        if idx is None:
+            self.keys[key] = len(self.names)
+            self.types.append(entry_type)
+            self.names.append(real_name)
+        else:
+            self.types[idx] = entry_type
+            self.names[idx] = real_name
+
+    def lookup(self, rel_path):
+        """返回命中的条目编号，未命中返回 -1"""
+        keys = self.keys
+        for key in probe_keys(rel_path):
+            idx = keys.get(key)
+            if idx is not None: return idx
+        return -1
+
+    def is_protector(self, idx):
+        return self.types[idx] == self.PROTECTOR
+
+    def assign_flat_names(self):
+        """
+        按映射表顺序给 protector 条目一次性分配 hotRes 下的文件名
+        结果只取决于映射表，与处理顺序、并发、输出目录里已有的文件都无关，
+        重复运行得到的文件名完全一致
+        """
+        registry = NameRegistry()
+        self.flat_names = [registry.claim(name) if t == self.PROTECTOR else None
+                           for t, name in zip(self.types, self.names)]
+
+    def save(self, path, fingerprint):
+        fp = fingerprint.encode('utf-8')
+        # Key 按编号顺序保存，加载时 zip 一下就能还原 dict
+        ordered = [None] * len(self.names)
+        for key, idx in self.keys.items():
+            ordered[idx] = key
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAPPING_CACHE_MAGIC)
+            f.write(len(fp).to_bytes(4, "little"))
+            f.write(fp)
+            marshal.dump((ordered, bytes(self.types), self.names, self.flat_names), f, 4)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        """用 mmap 读取缓存，指纹不符或文件损坏时返回 None"""
+        fp = fingerprint.encode('utf-8')
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                head = len(MAPPING_CACHE_MAGIC)
+                if mm[:head] != MAPPING_CACHE_MAGIC: return None
+                fp_len = int.from_bytes(mm[head:head + 4], "little")
+                if mm[head + 4:head + 4 + fp_len] != fp: return None
+                with memoryview(mm) as view:
+                    ordered, types, names, flat_names = marshal.loads(view[head + 4 + fp_len:])
+        except (OSError, ValueError, EOFError, TypeError):
+            return None
+        return cls(dict(zip(ordered, range(len(ordered)))), bytearray(types), names, flat_names)
+
+def iter_mapping_rows(prot_list, bundle_list):
+    """
+    按加载顺序产出 (来源文件, Key, 类型, 真实文件名)：先 bundle (基础层)，再依次每个 protector (覆盖层)
+    load_mappings 和 --analyze 共用，后产出的同名 Key 覆盖先产出的
+    """
     # 1. Bundle List (基础层)
     if os.path.exists(bundle_list):
         try:
-            with open(bundle_list, 'r', encoding='utf-8', errors='ignore') as f:
-                for line in f:
-                    parts = line.strip().split()
-                    if len(parts) >= 6:
-                        target_path = parts[-1].split(',')[0]
-                        # Key = 纯 UUID 路径 (小写)
-                        key = target_path.replace("\\", "/").lower()
-                        mapping[key] = {
-                            'type': 'bundle',
-                            'real_name': target_path 
-                        }
-        except: pass
+            for parts in load_manifest_rows(bundle_list):
+                if len(parts) >= 6:
+                    target_path = parts[-1].split(',')[0]
+                    # Key = 纯 UUID 路径 (小写)
+                    key = target_path.replace("\\", "/").lower()
+                    yield bundle_list, key, MappingIndex.BUNDLE, target_path
+        except Exception: pass
 
     # 2. Protector Lists (覆盖层)
     # 循环读取用户提供的每一个 protector 文件
@@ -69,161 +403,1081 @@ def load_mappings(prot_list, bundle_list):
         if os.path.exists(path):
             print(f"-> 读取: {os.path.basename(path)}")
             try:
-                with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                    for line in f:
-                        parts = line.strip().split()
-                        if len(parts) >= 2:
-                            # Key = 纯 UUID 路径 (小写)
-                            key = parts[1].replace("\\", "/").lower()
-                            mapping[key] = {
-                                'type': 'protector',
-                                'real_name': parts[0],
-                                'orig_path': parts[1]
-                            }
-            except: pass
+                for parts in load_manifest_rows(path):
+                    if len(parts) >= 2:
+                        # Key = 纯 UUID 路径 (小写)
+                        key = parts[1].replace("\\", "/").lower()
+                        yield path, key, MappingIndex.PROTECTOR, parts[0]
+            except Exception: pass
         else:
             print(f"-> [警告] 文件不存在: {path}")
 
+def load_mappings(prot_list, bundle_list, cache_path=None):
+    if cache_path:
+        fingerprint = mapping_fingerprint(prot_list, bundle_list)
+        mapping = MappingIndex.load(cache_path, fingerprint)
+        if mapping is not None:
+            print(f"\n映射表缓存命中，共 {len(mapping)} 条记录")
+            return mapping
+
+    mapping = MappingIndex()
+    print("\n正在加载映射表 (自动合并多个 Protector)...")
+    for _, key, entry_type, real_name in iter_mapping_rows(prot_list, bundle_list):
+        mapping.add(key, entry_type, real_name)
+
+    mapping.assign_flat_names()
     print(f"映射表加载完成，共合并 {len(mapping)} 条记录")
+    if cache_path:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            mapping.save(cache_path, fingerprint)
+        except OSError as e:
+            print(f"-> [警告] 映射表缓存写入失败: {e}")
     return mapping
 
+# ================= 文件类型识别 =================
+# (偏移, 魔数, 后缀)；后缀为 None 的是容器头，需要继续看 SUB_SIGNATURES
+SIGNATURES = [
+    (0, b'UnityFS', '.unity3d'),
+    (0, b'\x89PNG', '.png'),
+    (0, b'\xff\xd8\xff', '.jpg'),
+    (0, b'GIF8', '.gif'),
+    (0, b'RIFF', None),
+    (0, b'\xabKTX 11\xbb', '.ktx'),
+    (0, b'\xabKTX 20\xbb', '.ktx2'),
+    (0, b'\x13\xab\xa1\x5c', '.astc'),
+    (0, b'PVR\x03', '.pvr'),
+    (0, b'OggS', '.ogg'),
+    (0, b'ID3', '.mp3'),
+    (0, b'\xff\xfb', '.mp3'),
+    (0, b'\xff\xf3', '.mp3'),
+    (0, b'\xff\xf2', '.mp3'),
+    (0, b'fLaC', '.flac'),
+    (4, b'ftyp', '.mp4'),
+    (0, b'\x1bLua', '.luac'),
+    (0, b'\x1bLJ', '.luac'),     # LuaJIT 字节码
+]
+SUB_SIGNATURES = {
+    b'RIFF': [(8, b'WEBP', '.webp'), (8, b'WAVE', '.wav')],
+}
+SNIFF_LEN = 128     # 识别只需要文件头这么多字节 (atlas 的 size: 行也在这个范围内)
+
+# 首字节 -> 候选列表 (长魔数优先)，每个文件只比较同一首字节下的几条；不在开头的魔数单独列出
+_SIG_TABLE = {}
+_SIG_AT_OFFSET = []
+for _off, _magic, _ext in sorted(SIGNATURES, key=lambda sig: -len(sig[1])):
+    if _off: _SIG_AT_OFFSET.append((_off, _magic, _ext))
+    else: _SIG_TABLE.setdefault(_magic[0], []).append((_magic, _ext))
+
+# Spine 二进制骨骼：开头的 hash 之后是版本号字符串 (varint 长度+1 前缀)，如 "3.8.99" / "4.1.23"
+SPINE_SKEL_VERSION = re.compile(rb'[\x06-\x08][34]\.\d\.\d{1,2}')
+
 def guess_extension(data):
-    if len(data) < 4: return '.dat'
-    if data.startswith(b'UnityFS'): return '.unity3d'
-    if data.startswith(b'\x89PNG'): return '.png'
-    if data.startswith(b'FFD8FF'): return '.jpg'
-    if data.startswith(b'OggS'): return '.ogg'
-    if data.startswith(b'ID3') or data.startswith(b'\xff\xfb'): return '.mp3'
-    if data.startswith(b'\x1bLua'): return '.luac'
-    try:
-        if b"size:" in data[:100] and b".png" in data[:100]: return ".atlas"
-    except: pass
+    """按文件头识别后缀，data 可以是 bytes / memoryview / 流式解码的第一块"""
+    head = data[:SNIFF_LEN]
+    if type(head) is not bytes: head = bytes(head)
+    if len(head) < 4: return '.dat'
+
+    for magic, ext in _SIG_TABLE.get(head[0], ()):
+        if head.startswith(magic):
+            if ext: return ext
+            for sub_off, sub_magic, sub_ext in SUB_SIGNATURES[magic]:
+                if head.startswith(sub_magic, sub_off): return sub_ext
+    for off, magic, ext in _SIG_AT_OFFSET:
+        if head.startswith(magic, off): return ext
+
+    # 文本类：Spine JSON / ATLAS
+    stripped = head.lstrip()
+    if stripped.startswith(b'{') and b'"skeleton"' in stripped: return '.json'
+    if b"size:" in head and b".png" in head: return '.atlas'
+    if SPINE_SKEL_VERSION.search(head, 0, 48): return '.skel'
     return '.dat'
 
-def smart_decrypt(data):
-    if not data: return None
+def xxtea_decrypt_padded(buf):
+    """buf 为已按 4 字节补 0 的 bytearray，直接交给 xxtea，不再拼接/切片"""
+    with stage("xxtea"):
+        return xxtea.decrypt(buf, KEY, padding=False)
+
+def iter_inflate(dec):
+    """把 XXTEA 解密结果 (跳过首字节) 分块送进 zlib，逐块产出解压数据"""
+    view = memoryview(dec)[1:]
+    d = zlib.decompressobj()
+    for i in range(0, len(view), STREAM_CHUNK):
+        with stage("zlib"):
+            out = d.decompress(view[i:i + STREAM_CHUNK])
+        if out: yield out
+        if d.eof: break
+    with stage("zlib"):
+        out = d.flush()
+    if out: yield out
+    if not d.eof:
+        raise zlib.error("incomplete or truncated stream")
+
+def triage(head):
+    """只看文件头分类：'xxtea' (HEADER_BYTES 开头) / 'zip' / 'raw'，不读整个文件"""
+    if len(head) > len(HEADER_BYTES) and head.startswith(HEADER_BYTES): return 'xxtea'
+    if head.startswith(b'PK\x03\x04'): return 'zip'
+    return 'raw'
+
+def iter_decoded(f, size=None, depth=0, budget=None):
+    """
+    smart_decrypt 的流式版本：从已打开的 (可 seek) 源文件按块产出解密后的数据，不整份缓存文件
+    XXTEA 只能整块解密，但补 0、切片、解压结果都不再额外复制；ZIP 成员同样逐块读取
+    size 为 None 时取 f 的文件大小；depth / budget 为 ZIP 嵌套层数和剩余解压额度
+    """
+    header_len = len(HEADER_BYTES)
+    if size is None: size = os.fstat(f.fileno()).st_size
+    f.seek(0)
+    head = f.read(header_len)
+
     # 1. XXTEA
-    if len(data) > len(HEADER_BYTES) and data[:len(HEADER_BYTES)] == HEADER_BYTES:
+    if size > header_len and head == HEADER_BYTES:
+        n = size - header_len
+        buf = bytearray(n + (4 - n % 4) % 4)
+        with stage("read"):
+            f.readinto(memoryview(buf)[:n])
+        first = b""
         try:
-            ed = data[len(HEADER_BYTES):]
-            pad = (4 - (len(ed) % 4)) % 4
-            dec = xxtea.decrypt(ed + b"\x00" * pad, KEY, padding=False)
-            if dec: return zlib.decompress(dec[1:])
-        except: pass
-    # 2. ZIP (Nested)
-    if data.startswith(b'PK\x03\x04'):
+            dec = xxtea_decrypt_padded(buf)
+            del buf
+            if dec:
+                chunks = iter_inflate(dec)
+                first = next(chunks, b"")
+        except (zlib.error, ValueError): pass
+        # 第一块解压成功才算是 XXTEA+zlib，否则按原逻辑退回 ZIP/Raw
+        # 之后的解压错误直接抛出 (输出文件会被删掉并记入错误)，不能把半截明文和原文件拼在一起
+        if first:
+            yield first
+            yield from chunks
+            return
+
+    # 2. ZIP (Nested)：只取第一个成员 (与旧版相同)，其余成员见 save_zip_members
+    if head.startswith(b'PK\x03\x04'):
+        f.seek(0)
         try:
-            with zipfile.ZipFile(io.BytesIO(data)) as z:
-                return smart_decrypt(z.read(z.namelist()[0]))
-        except: pass
-    # 3. Raw
-    return data
+            z = zipfile.ZipFile(f)
+        except zipfile.BadZipFile:
+            z = None
+        if z is not None:
+            with z:
+                members = zip_members(z)
+                if members:
+                    yield from iter_member(z, members[0], depth + 1, budget)
+                    return
 
-def get_unique_output_path(base_dir, filename):
-    name, ext = os.path.splitext(filename)
-    counter = 1
-    new_filename = filename
+    # 3. Raw
+    f.seek(0)
     while True:
-        full_path = os.path.join(base_dir, new_filename)
-        if not os.path.exists(full_path):
-            return full_path
-        counter += 1
-        new_filename = f"{name}_{counter}{ext}"
+        with stage("read"):
+            chunk = f.read(STREAM_CHUNK)
+        if not chunk: break
+        yield chunk
+
+def zip_members(z):
+    return [info for info in z.infolist() if not info.is_dir()]
+
+def iter_member(z, info, depth, budget=None):
+    """
+    逐块产出 ZIP 成员解码后的数据，成员本身还可能是 XXTEA 或下一层 ZIP
+    budget 为 [剩余字节数]，同一个源文件的所有层共用，超出嵌套层数或额度直接报错 (防 ZIP 炸弹)
+    """
+    if depth > ZIP_MAX_DEPTH:
+        raise ValueError(f"ZIP 嵌套超过 {ZIP_MAX_DEPTH} 层")
+    if budget is None: budget = [ZIP_MAX_BYTES]
+    budget[0] -= info.file_size
+    if budget[0] < 0:
+        raise ValueError(f"ZIP 解压总大小超过 {ZIP_MAX_BYTES >> 20} MB")
+
+    with z.open(info) as member:
+        if member.read(4) != b'PK\x03\x04':
+            # 成员内 seek 回开头只是重新解压已读的几个字节
+            yield from iter_decoded(member, info.file_size, depth, budget)
+            return
+        # 下一层 ZIP 需要随机访问，压缩成员上 seek 要从头重新解压，所以先转存：小的在内存，大的落到临时文件
+        with tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX) as spool:
+            spool.write(b'PK\x03\x04')
+            shutil.copyfileobj(member, spool, STREAM_CHUNK)
+            yield from iter_decoded(spool, info.file_size, depth, budget)
 
-def decrypt_and_save(file_path, mapping, source_root, output_root):
+def member_path(name):
+    """ZIP 成员名 -> 安全的相对路径，去掉绝对路径、盘符和 .. (防止写到输出目录外)"""
+    parts = [p.replace(":", "_") for p in name.replace("\\", "/").split("/") if p not in ("", ".", "..")]
+    return os.path.join(*parts) if parts else ""
+
+def save_zip_members(f, main_path, output_root, opts=None):
+    """
+    --zip-all：第一个成员已按映射表还原到 main_path，其余成员解到 <main_path 去掉后缀>/<成员名>
+    每个成员同样逐块解码、写盘
+    """
+    f.seek(0)
+    try:
+        z = zipfile.ZipFile(f)
+    except zipfile.BadZipFile:
+        return
+    with z:
+        members = zip_members(z)
+        if len(members) < 2: return
+        base_dir = os.path.splitext(main_path)[0]
+        budget = [ZIP_MAX_BYTES - members[0].file_size]
+        for info in members[1:]:
+            rel = member_path(info.filename)
+            if not rel: continue
+            chunks = iter_member(z, info, 1, budget)
+            first = next(chunks, b"")
+            if not first: continue
+            path = os.path.join(base_dir, rel)
+            if "." not in os.path.basename(rel): path += guess_extension(first)
+            # 成员的子目录不在 plan_output_dirs 的预建范围内
+            write_restored(path, first, chunks, output_root, dict(opts or {}, dirs_ready=False))
+
+def smart_decrypt(data):
+    """
+    内存版本：整份数据进、整份结果出，解码逻辑与 iter_decoded 相同
+    解不开的 ZIP 在 iter_decoded 里已按原样返回；嵌套/额度超限、数据截断等照常抛出，
+    由调用方 report_error，各引擎的输出和错误分类保持一致
+    """
+    if not data: return None
+    return b"".join(iter_decoded(io.BytesIO(data), len(data)))
+
+def decrypt_and_save(file_path, mapping, source_root, output_root, opts=None):
+    """返回写入的输出路径；不需要输出时返回 ""，出错返回 None"""
     try:
-        if file_path.endswith(".txt") or file_path.endswith(".py"): return
+        if file_path.endswith(".txt") or file_path.endswith(".py"): return ""
+        rel_path = os.path.relpath(file_path, source_root).replace("\\", "/")
 
         with open(file_path, "rb") as f:
-            raw_data = f.read()
+            # 先只读文件头分类：未加密、未打包的文件解码结果就是原文件，不经过 Python 直接复制/链接
+            with stage("read"):
+                head = f.read(SNIFF_LEN)
+            if not head: return ""
+            if STATS is not None:
+                STATS.count("files")
+                STATS.count("bytes_in", os.fstat(f.fileno()).st_size)
+            opts = opts or {}
+            if not opts.get('dedupe') and not opts.get('pack') and triage(head) == 'raw':
+                idx = lookup_counted(mapping, rel_path)
+                final_abs_path = output_path_for(rel_path, head, idx, mapping, output_root)
+                if not opts.get('dirs_ready'):
+                    os.makedirs(os.path.dirname(final_abs_path), exist_ok=True)
+                count("raw_passthrough")
+                with stage("copy"):
+                    passthrough_raw(f, file_path, final_abs_path, opts.get('link_raw'), opts.get('fsync') == "file")
+                return final_abs_path
 
-        final_data = smart_decrypt(raw_data)
-        if not final_data: return
+            # 只取第一块用于判断后缀，其余块直接写盘
+            chunks = iter_decoded(f)
+            final_data = next(chunks, b"")
+            if not final_data: return ""
+            final_abs_path = save_decoded(rel_path, final_data, chunks, mapping, output_root, opts)
+            if opts.get('zip_all') and triage(head) == 'zip':
+                save_zip_members(f, final_abs_path, output_root, opts)
+            return final_abs_path
 
-        # === 查找映射 ===
-        rel_path = os.path.relpath(file_path, source_root).replace("\\", "/")
-        
-        # 尝试提取 Key (去除第一层目录前缀)
-        parts = rel_path.split("/", 1)
-        lookup_key = parts[1].lower() if len(parts) > 1 else rel_path.lower()
-        
-        info = mapping.get(lookup_key)
-        # 再次尝试：直接用完整相对路径查（防止新文件夹结构不同）
-        if not info:
-             info = mapping.get(rel_path.lower())
-        # 再次尝试：去掉后缀查
-        if not info:
-            base, _ = os.path.splitext(lookup_key)
-            info = mapping.get(base)
-
-        output_rel_path = ""
-
-        if info:
-            # === [命中] 已知文件 (还原名字) ===
-            if info['type'] == 'protector':
-                rname = info['real_name']
-                # 放入 hotRes，并扁平化 (直接放 hotRes 根目录)
-                output_rel_path = os.path.join("hotRes", rname)
+    except Exception as e:
+        report_error(e, file_path)
+        return None
+
+def restore_bytes(data, rel_path, mapping, output_root, opts=None):
+    """
+    decrypt_and_save 的内存版本：数据已经在内存里 (如边下边还原)，不经过源文件
+    rel_path 为相对于 files 目录的路径，如 hotRes/xx/xxxx
+    """
+    try:
+        final_data = smart_decrypt(data)
+        if not final_data: return ""
+        return save_decoded(rel_path.replace("\\", "/"), final_data, (), mapping, output_root, opts)
+    except Exception as e:
+        report_error(e, rel_path)
+        return None
+
+def save_decoded(rel_path, final_data, chunks, mapping, output_root, opts=None):
+    """final_data 为第一块解密数据 (用来判断后缀)，chunks 为剩余的块"""
+    # === 查找映射 ===
+    # 依次尝试: 去除第一层目录前缀 / 完整相对路径 (防止新文件夹结构不同) / 去掉后缀
+    idx = lookup_counted(mapping, rel_path)
+    final_abs_path = output_path_for(rel_path, final_data, idx, mapping, output_root)
+    return write_restored(final_abs_path, final_data, chunks, output_root, opts)
+
+def write_restored(final_abs_path, final_data, chunks, output_root, opts=None):
+    # === 写入处理 ===
+    # 输出目录已由 plan_output_dirs 统一建好时不再逐个文件 makedirs
+    opts = opts or {}
+    pack = opts.get('pack')
+    if pack:
+        # 包模式：条目名就是散文件模式下相对于输出目录的路径
+        # 先看还有没有第二块：只有一块 (小文件的常见情况) 时大小已知，不必按 ZIP64 写
+        second = next(chunks, None) if chunks else None
+        arcname = os.path.relpath(final_abs_path, output_root)
+        with stage("write"):
+            if second is None:
+                size = pack.add(arcname, final_data)
             else:
-                rname = info['real_name']
-                if "." not in rname: rname += guess_extension(final_data)
-                output_rel_path = os.path.join("bundleRes", rname)
+                size = pack.add(arcname, final_data, itertools.chain((second,), chunks), stream=True)
+            count("bytes_out", size)
+        return final_abs_path
+    if not opts.get('dirs_ready'):
+        os.makedirs(os.path.dirname(final_abs_path), exist_ok=True)
+
+    sync = opts.get('fsync') == "file"
+    dedupe = opts.get('dedupe')
+    if dedupe:
+        return write_deduped(final_abs_path, final_data, chunks, output_root, dedupe, sync)
+    write_output(final_abs_path, final_data, chunks, sync=sync)
+    return final_abs_path
+
+def plan_output_dirs(files_to_proc, mapping, source_root, output_root, created=None):
+    """
+    在文件交给还原引擎之前创建它的输出目录，每个目录只 makedirs 一次，避免每个文件都 stat/mkdir
+    目录只取决于映射结果：protector -> hotRes，bundle -> bundleRes/名字里的目录，未命中 -> 原相对目录
+    生成器：边扫描边建目录，created 为已建目录的集合
+    """
+    created = set() if created is None else created
+    for path in files_to_proc:
+        rel_path = os.path.relpath(path, source_root).replace("\\", "/")
+        idx = mapping.lookup(rel_path)
+        if idx < 0:
+            d = os.path.dirname(rel_path)
+        elif mapping.is_protector(idx):
+            d = "hotRes"
         else:
-            # === [未命中] 未知文件 (保留原目录结构) ===
-            # V6 改进：不再强行归类到 Unknown，而是保留它在 source_root 下的相对位置
-            
-            ext = guess_extension(final_data)
-            base_name = os.path.basename(file_path)
-            
-            # 修正文件名后缀
-            if base_name.endswith(ext):
-                final_name = base_name
-            else:
-                final_name = base_name + ext
-            
-            # 构建路径： output_root + 原相对目录 + 文件名
-            # 例如: source/NewFolder/123 -> output/NewFolder/123.dat
-            parent_dir = os.path.dirname(rel_path)
-            output_rel_path = os.path.join(parent_dir, final_name)
-
-        # === 写入处理 ===
-        final_abs_path = os.path.join(output_root, output_rel_path)
-        final_dir = os.path.dirname(final_abs_path)
+            d = os.path.join("bundleRes", os.path.dirname(mapping.names[idx]))
+        if d not in created:
+            try:
+                os.makedirs(os.path.join(output_root, d), exist_ok=True)
+                created.add(d)
+            except OSError:
+                # 建不了的目录 (如同名文件占位) 不记入 created，下一个文件再试；
+                # 这个文件照常交给引擎，写入时失败按单个文件报 [Error]，不中断整个还原
+                pass
+        yield path
+
+def output_path_for(rel_path, head, idx, mapping, output_root):
+    """根据映射结果 idx (未命中为 -1) 和解密后的文件头决定输出路径"""
+    is_protector = idx >= 0 and mapping.is_protector(idx)
+
+    output_rel_path = ""
+
+    if idx >= 0:
+        # === [命中] 已知文件 (还原名字) ===
+        if is_protector:
+            # 放入 hotRes，并扁平化 (直接放 hotRes 根目录)，重名已在加载映射表时按顺序编号
+            output_rel_path = os.path.join("hotRes", mapping.flat_names[idx])
+        else:
+            rname = mapping.names[idx]
+            if "." not in rname:
+                with stage("sniff"):
+                    rname += guess_extension(head)
+            output_rel_path = os.path.join("bundleRes", rname)
+    else:
+        # === [未命中] 未知文件 (保留原目录结构) ===
+        # V6 改进：不再强行归类到 Unknown，而是保留它在 source_root 下的相对位置
+        
+        with stage("sniff"):
+            ext = guess_extension(head)
+        base_name = os.path.basename(rel_path)
         
-        os.makedirs(final_dir, exist_ok=True)
+        # 修正文件名后缀
+        if base_name.endswith(ext):
+            final_name = base_name
+        else:
+            final_name = base_name + ext
         
-        # 如果是 hotRes (扁平化区域)，需要防止重名
-        if "hotRes" in output_rel_path and info and info['type'] == 'protector':
-             final_abs_path = get_unique_output_path(final_dir, os.path.basename(output_rel_path))
+        # 构建路径： output_root + 原相对目录 + 文件名
+        # 例如: source/NewFolder/123 -> output/NewFolder/123.dat
+        parent_dir = os.path.dirname(rel_path)
+        output_rel_path = os.path.join(parent_dir, final_name)
+
+    return os.path.join(output_root, output_rel_path)
+
+def write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def unlink_output(path):
+    """
+    写输出前先删掉旧文件：上次 --link-raw / --dedupe 留下的可能是硬链接，
+    直接 O_TRUNC 打开会改写到源文件或其他输出
+    """
+    try: os.remove(path)
+    except FileNotFoundError: pass
+
+def write_output(path, first, chunks, hasher=None, sync=False):
+    """
+    直接用 os.open/os.write：小文件整份只有一次 write，省掉 open() 缓冲对象的 fstat/ioctl/lseek
+    sync 为 True 时关闭前 fsync (--fsync file)
+    """
+    unlink_output(path)
+    fd = os.open(path, WRITE_FLAGS, 0o666)
+    try:
+        with stage("write"):
+            write_all(fd, first)
+        written = len(first)
+        if hasher: hasher.update(first)
+        for chunk in chunks:
+            with stage("write"):
+                write_all(fd, chunk)
+            written += len(chunk)
+            if hasher: hasher.update(chunk)
+        if sync:
+            with stage("fsync"):
+                os.fsync(fd)
+        count("bytes_out", written)
+    except:
+        # 流式解压中途出错时不要留下半截文件
+        os.close(fd)
+        os.remove(path)
+        raise
+    os.close(fd)
+    return written
+
+# ================= 原样复制 =================
+# 数据在内核里搬运，不经过 Python 内存；前一种不可用 (老内核、跨文件系统、Windows) 时换下一种
+def _copy_file_range(in_fd, out_fd, offset, count):
+    return os.copy_file_range(in_fd, out_fd, count, offset, offset)
+
+def _sendfile(in_fd, out_fd, offset, count):
+    return os.sendfile(out_fd, in_fd, offset, count)
+
+KERNEL_COPIERS = [fn for name, fn in (("copy_file_range", _copy_file_range), ("sendfile", _sendfile))
+                  if hasattr(os, name)]
+
+def passthrough_raw(src, src_path, path, link=False, sync=False):
+    """
+    原始文件不需要解码：link 时优先硬链接到源文件，跨文件系统等情况退回 copy_raw
+    """
+    if link:
+        unlink_output(path)
+        try:
+            os.link(src_path, path)
+            return
+        except OSError:
+            pass
+    copy_raw(src, path, sync)
+
+def copy_raw(src, path, sync=False):
+    """把已打开的源文件 src 原样复制到 path：copy_file_range -> sendfile -> 普通逐块复制"""
+    in_fd = src.fileno()
+    size = os.fstat(in_fd).st_size
+    done = 0
+    unlink_output(path)
+    try:
+        with open(path, "wb") as dst:
+            out_fd = dst.fileno()
+            for copier in KERNEL_COPIERS:
+                try:
+                    os.lseek(out_fd, done, os.SEEK_SET)
+                    while done < size:
+                        n = copier(in_fd, out_fd, done, min(size - done, 1 << 30))
+                        if not n: break
+                        done += n
+                    break
+                except OSError:
+                    continue
+            if done < size:
+                src.seek(done)
+                dst.seek(done)
+                shutil.copyfileobj(src, dst, STREAM_CHUNK)
+            if sync:
+                dst.flush()
+                os.fsync(out_fd)
+        count("bytes_out", size)
+    except:
+        os.remove(path)
+        raise
+
+# ================= 去重 =================
+# .dedupe/<哈希前两位>/<哈希> 是第一次写出的那份文件的硬链接：
+# 只占一个目录项；多进程同时登记时 os.link 只会有一个成功
+def content_marker(output_root, digest):
+    return os.path.join(output_root, DEDUPE_DIR, digest[:2], digest)
+
+def marker_valid(marker, digest, size):
+    """
+    登记的内容文件与输出共用 inode，可能已被改写 (旧版本经硬链接写穿、手动修改输出等)
+    大小和哈希都对上才拿来链接；对不上的删掉，由本次的输出重新登记
+    """
+    try:
+        if os.stat(marker).st_size == size:
+            hasher = hashlib.blake2b(digest_size=16)
+            with open(marker, "rb") as f:
+                for chunk in iter(lambda: f.read(STREAM_CHUNK), b""):
+                    hasher.update(chunk)
+            if hasher.hexdigest() == digest: return True
+        os.remove(marker)
+    except OSError:
+        pass
+    return False
+
+def register_content(path, marker):
+    try:
+        os.makedirs(os.path.dirname(marker), exist_ok=True)
+        os.link(path, marker)
+    except OSError:
+        # 已被其他进程登记，或文件系统不支持硬链接 (此时去重不生效)
+        pass
+
+def clone_file(src, dst):
+    import fcntl     # 仅 Linux/Unix
+    with open(src, "rb") as fs, open(dst, "wb") as fd:
+        fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+
+def link_duplicate(src, dst, mode):
+    """把 dst 换成 src 的硬链接 / reflink，失败 (跨盘、文件系统不支持) 返回 False"""
+    tmp = dst + ".dedupe.tmp"
+    try:
+        if mode == "hardlink": os.link(src, tmp)
+        else: clone_file(src, tmp)
+        os.replace(tmp, dst)
+        return True
+    except (OSError, ImportError):
+        try: os.remove(tmp)
+        except OSError: pass
+        return False
+
+def record_duplicate(output_root, out_rel, marker):
+    marker_rel = os.path.relpath(marker, output_root).replace("\\", "/")
+    line = f"{out_rel}\t{marker_rel}\n".encode('utf-8')
+    fd = os.open(os.path.join(output_root, DEDUPE_DIR, DEDUPE_INDEX), os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+    try: os.write(fd, line)
+    finally: os.close(fd)
+
+def share_duplicate(marker, path, output_root, mode):
+    if mode == "index":
+        if os.path.lexists(path): os.remove(path)
+        record_duplicate(output_root, os.path.relpath(path, output_root).replace("\\", "/"), marker)
+        return True
+    return link_duplicate(marker, path, mode)
+
+def write_deduped(path, first, chunks, output_root, mode, sync=False):
+    """
+    边写边算内容哈希，重复的内容换成链接或只记录到索引
+    整个文件只有一块时 (小文件的常见情况) 先算哈希，重复的话根本不写盘
+    """
+    # 上次运行留下的可能是硬链接，先断开，免得改写到别的文件
+    unlink_output(path)
+
+    second = next(chunks, None) if chunks else None
+    hasher = hashlib.blake2b(digest_size=16)
+    if second is None:
+        hasher.update(first)
+        digest = hasher.hexdigest()
+        marker = content_marker(output_root, digest)
+        if marker_valid(marker, digest, len(first)) and share_duplicate(marker, path, output_root, mode):
+            return path
+        write_output(path, first, (), sync=sync)
+    else:
+        size = write_output(path, first, itertools.chain((second,), chunks), hasher, sync)
+        digest = hasher.hexdigest()
+        marker = content_marker(output_root, digest)
+        if marker_valid(marker, digest, size) and share_duplicate(marker, path, output_root, mode):
+            return path
+    register_content(path, marker)
+    return path
+
+# ================= 增量状态库 =================
+# files 表: 源文件相对路径 -> (大小, mtime_ns, 输出相对路径)
+# meta 表: 映射表指纹，映射表变化后旧记录全部作废 (输出文件名可能改变)
+
+def mapping_fingerprint(prot_list, bundle_list):
+    items = []
+    for path in [bundle_list] + list(prot_list):
+        try:
+            st = os.stat(path)
+            items.append(f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}")
+        except OSError:
+            items.append(f"{os.path.abspath(path)}|-")
+    return "\n".join(items)
+
+def output_fingerprint(output_root, pack_path=None):
+    """增量记录只对同一种输出有效：散文件目录和各个包分别记录，互不沿用"""
+    if pack_path: return f"pack|{os.path.abspath(pack_path)}"
+    return f"dir|{os.path.abspath(output_root)}"
+
+def open_state_db(db_path, fingerprint, reset=False):
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS files (rel TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, out TEXT)")
+    row = conn.execute("SELECT v FROM meta WHERE k='mapping'").fetchone()
+    if reset or row is None or row[0] != fingerprint:
+        if row is not None:
+            print("映射表或输出位置已变化，增量记录作废，将全量还原")
+        conn.execute("DELETE FROM files")
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('mapping', ?)", (fingerprint,))
+    conn.commit()
+    return conn
+
+def load_state(conn):
+    return {rel: (size, mtime, out) for rel, size, mtime, out in conn.execute("SELECT rel, size, mtime, out FROM files")}
+
+def save_state(conn, rows):
+    conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+
+def filter_unchanged(entries, state, source_root, output_root, stats, skipped):
+    """
+    生成器：从扫描结果 (DirEntry) 中产出需要处理的路径，stats 记录 {路径: (rel, size, mtime)}
+    已变化文件的旧输出顺手删除 (output_root 为 None 时不删，如包模式)；skipped 为 [未变化的文件数]
+    """
+    for entry in entries:
+        path = entry.path
+        st = entry.stat()
+        rel = os.path.relpath(path, source_root).replace("\\", "/")
+        prev = state.get(rel)
+        if prev and prev[0] == st.st_size and prev[1] == st.st_mtime_ns:
+            skipped[0] += 1
+            continue
+        if prev and prev[2] and output_root:
+            # 内容变了：删掉旧输出，避免扁平化目录里再生成一个 _2
+            try: os.remove(os.path.join(output_root, prev[2]))
+            except OSError: pass
+        stats[path] = (rel, st.st_size, st.st_mtime_ns)
+        yield path
+
+def state_row(path, result, stats, output_root):
+    rel, size, mtime = stats[path]
+    out_rel = os.path.relpath(result, output_root).replace("\\", "/") if result else ""
+    return (rel, size, mtime, out_rel)
+
+# ================= 进程池 =================
+# 映射表只在每个 worker 启动时传递一次 (initializer)，而不是随每个任务序列化
+_worker_ctx = {}
+
+def _init_worker(mapping, source_root, output_root, opts=None):
+    _worker_ctx['mapping'] = mapping
+    _worker_ctx['source_root'] = source_root
+    _worker_ctx['output_root'] = output_root
+    _worker_ctx['opts'] = opts
+    if opts and opts.get('report'):
+        global STATS
+        STATS = RunStats()
+
+def _restore_file_task(file_path):
+    ctx = _worker_ctx
+    return decrypt_and_save(file_path, ctx['mapping'], ctx['source_root'], ctx['output_root'], ctx['opts'])
+
+def _process_chunk(chunk):
+    """返回 (结果列表, 本批统计)，未开启 --report 时统计为 None"""
+    results = [(file_path, _restore_file_task(file_path)) for file_path in chunk]
+    return results, STATS.take() if STATS is not None else None
+
+def _restore_bytes_task(data, rel_path):
+    return restore_bytes(data, rel_path, _worker_ctx['mapping'], _worker_ctx['output_root'], _worker_ctx['opts'])
+
+def iter_chunks(items, size):
+    """items 可以是列表，也可以是边扫描边产出的生成器"""
+    it = iter(items)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk: return
+        yield chunk
+
+def run_parallel(files_to_proc, mapping, src, out, workers, chunk_size, on_done=None, opts=None, total=None):
+    """files_to_proc 可以是生成器：扫描和还原同时进行，同时在途的批次数有上限，不会一次提交全部文件"""
+    def collect(futures, return_when):
+        done, pending = concurrent.futures.wait(futures, return_when=return_when)
+        for fut in done:
+            results, stats = fut.result()
+            if stats and STATS is not None: STATS.merge(stats)
+            if on_done: on_done(results)
+            pbar.update(len(results))
+        return pending
+
+    workers = clamp_workers(workers)
+    with tqdm(total=total, unit="file", ncols=80) as pbar:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                    initargs=(mapping, src, out, opts)) as executor:
+            pending = set()
+            for chunk in iter_chunks(files_to_proc, chunk_size):
+                pending.add(executor.submit(_process_chunk, chunk))
+                if len(pending) >= workers * 4:
+                    pending = collect(pending, concurrent.futures.FIRST_COMPLETED)
+            collect(pending, concurrent.futures.ALL_COMPLETED)
+
+def run_serial(files_to_proc, mapping, src, out, on_done=None, opts=None, total=None):
+    for f in tqdm(files_to_proc, total=total, unit="file", ncols=80):
+        result = decrypt_and_save(f, mapping, src, out, opts)
+        if on_done: on_done([(f, result)])
+
+# ================= 扫描源目录 =================
+def scan_source(source_root, skip_dir, skip_file, workers=DEFAULT_SCAN_WORKERS, want_stat=False):
+    """
+    多线程 os.scandir 扫描源目录：每个目录是一个任务，顶层的多个目录同时扫描
+    生成器，边扫描边按目录成批产出文件的 DirEntry，不用等整棵树扫完，也不在内存里攒完整列表
+    want_stat 时在扫描线程里先 stat 一次 (DirEntry 会缓存)，增量比对时不再单独 stat
+    skip_dir(entry) / skip_file(entry) 返回 True 的目录 / 文件跳过
+    """
+    dir_q = queue.Queue()
+    out_q = queue.Queue(SCAN_QUEUE_SIZE)
+    lock = threading.Lock()
+    pending = [1]     # 已发现但还没扫完的目录数，归零即全部扫完
+
+    def scan(path):
+        files, subdirs = [], []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not skip_dir(entry): subdirs.append(entry.path)
+                        elif entry.is_file() and not skip_file(entry):
+                            if want_stat: entry.stat()
+                            files.append(entry)
+                    except OSError:
+                        pass
+        except OSError as e:
+            if STATS is not None: STATS.error(e, path)
+            tqdm.write(f"[Error] 无法扫描 {path}: {e}")
+        with lock: pending[0] += len(subdirs)
+        for d in subdirs: dir_q.put(d)
+        if files: out_q.put(files)
+
+    def loop():
+        while True:
+            path = dir_q.get()
+            if path is _DONE: return
+            try:
+                scan(path)
+            finally:
+                with lock:
+                    pending[0] -= 1
+                    finished = pending[0] == 0
+                if finished:
+                    out_q.put(_DONE)
+                    for _ in range(workers): dir_q.put(_DONE)
+
+    for _ in range(workers):
+        threading.Thread(target=loop, daemon=True).start()
+    dir_q.put(source_root)
+    while True:
+        batch = out_q.get()
+        if batch is _DONE: return
+        yield from batch
+
+# ================= 映射覆盖率分析 (--analyze) =================
+ANALYZE_SHOW = 20   # 控制台每类最多列出的条数，完整明细看报告文件
+
+def collect_overrides(prot_list, bundle_list):
+    """
+    按 load_mappings 的顺序重放一遍清单，记录被后加入条目覆盖掉的 Key
+    返回 ({Key: (类型, 真实文件名, 来源)}, 覆盖明细, 各来源行数)
+    """
+    final, overrides, rows = {}, [], Counter()
+    for source, key, entry_type, real_name in iter_mapping_rows(prot_list, bundle_list):
+        source = os.path.basename(source)
+        rows[source] += 1
+        old = final.get(key)
+        if old is not None:
+            overrides.append({'key': key, 'old_source': old[2], 'old_name': old[1],
+                              'new_source': source, 'new_name': real_name, 'conflict': old[1] != real_name})
+        final[key] = (entry_type, real_name, source)
+    return final, overrides, rows
+
+def match_disk_files(keys, rel_paths):
+    """每个磁盘文件按还原时的顺序探测一次，返回 (被命中的 Key 集合, 未映射的文件)"""
+    hit, unmapped = set(), []
+    for rel_path in rel_paths:
+        for key in probe_keys(rel_path):
+            if key in keys:
+                hit.add(key)
+                break
+        else:
+            unmapped.append(rel_path)
+    return hit, unmapped
+
+def analyze_mappings(prot_list, bundle_list, rel_paths, report_path):
+    """清单和磁盘各索引一次，用集合运算得出覆盖冲突 / 缺失 / 未映射，打印摘要并写出 JSON 明细"""
+    final, overrides, rows = collect_overrides(prot_list, bundle_list)
+    rel_paths = list(rel_paths)
+    hit, unmapped = match_disk_files(final, rel_paths)
+    missing = sorted(final.keys() - hit)
+    by_dir = Counter(os.path.dirname(p) or "." for p in unmapped)
+    pairs = Counter(f"{o['old_source']} -> {o['new_source']}" for o in overrides)
+    type_names = {MappingIndex.BUNDLE: "bundle", MappingIndex.PROTECTOR: "protector"}
+
+    print("\n=== 映射覆盖率分析 ===")
+    for source, n in rows.items(): print(f"清单 {source}: {n} 行")
+    print(f"去重后 Key: {len(final)}  磁盘文件: {len(rel_paths)}  命中: {len(hit)}")
+    conflicts = sum(o['conflict'] for o in overrides)
+    print(f"\n覆盖: {len(overrides)} 条 (其中真实文件名不同: {conflicts})")
+    for pair, n in pairs.most_common(): print(f"  {pair}: {n}")
+    print(f"\n磁盘上缺失的条目: {len(missing)} (可用 download_hotres 补下载)")
+    for key in missing[:ANALYZE_SHOW]: print(f"  [{type_names[final[key][0]]}] {key} -> {final[key][1]}")
+    print(f"\n未映射的文件: {len(unmapped)} (按目录)")
+    for d, n in by_dir.most_common(ANALYZE_SHOW): print(f"  {d}: {n}")
+
+    report = {
+        'rows': dict(rows),
+        'keys': len(final),
+        'disk_files': len(rel_paths),
+        'hit': len(hit),
+        'overrides': overrides,
+        'override_pairs': dict(pairs),
+        'missing': [{'key': k, 'type': type_names[final[k][0]], 'name': final[k][1], 'source': final[k][2]} for k in missing],
+        'unmapped_by_dir': dict(by_dir.most_common()),
+        'unmapped': sorted(unmapped),
+    }
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n分析明细已写入: {report_path}")
 
-        with open(final_abs_path, "wb") as f:
-            f.write(final_data)
+# ================= 线程流水线 =================
+# 读文件 -> 解码 -> 写盘 三段各自一组线程，段之间用有界队列连接，某段跟不上时上游自然阻塞
+# 文件读写和 zlib 解压都会释放 GIL，I/O 延迟大 (NFS/SMB) 时能把等待时间重叠起来
+_DONE = object()
 
+def start_stage(work, count, in_q, out_q, next_count):
+    """启动 count 个线程对 in_q 的每一项执行 work(item)，结果放入 out_q；全部结束后放 next_count 个结束标记"""
+    def loop():
+        while True:
+            item = in_q.get()
+            if item is _DONE: return
+            out_q.put(work(item))
+    threads = [threading.Thread(target=loop, daemon=True) for _ in range(count)]
+    for t in threads: t.start()
+    def close():
+        for t in threads: t.join()
+        for _ in range(next_count): out_q.put(_DONE)
+    threading.Thread(target=close, daemon=True).start()
+
+def read_item(path, opts):
+    """读取阶段：小的加密/ZIP 文件整份读进内存；原始文件和大文件只传路径，由解码阶段直接复制或流式处理"""
+    try:
+        with open(path, "rb") as f, stage("read"):
+            head = f.read(SNIFF_LEN)
+            if triage(head) == 'raw' and not opts.get('dedupe') and not opts.get('pack'): return path, None
+            if os.fstat(f.fileno()).st_size > PREFETCH_MAX: return path, None
+            data = head + f.read()
+        count("files")
+        count("bytes_in", len(data))
+        return path, data
+    except Exception as e:
+        report_error(e, path)
+        return path, False
+
+def decode_item(item, mapping, src, out, opts):
+    """解码阶段：返回 (路径, 输出路径, 解码数据, 结果)，输出路径为 None 表示已处理完，直接交回结果"""
+    path, data = item
+    if data is False: return path, None, None, None
+    if data is None: return path, None, None, decrypt_and_save(path, mapping, src, out, opts)
+    try:
+        final_data = smart_decrypt(data)
+        if not final_data: return path, None, None, ""
+        rel_path = os.path.relpath(path, src).replace("\\", "/")
+        final_abs_path = output_path_for(rel_path, final_data, lookup_counted(mapping, rel_path), mapping, out)
+        if opts.get('zip_all') and triage(data[:SNIFF_LEN]) == 'zip':
+            os.makedirs(os.path.dirname(final_abs_path), exist_ok=True)
+            save_zip_members(io.BytesIO(data), final_abs_path, out, opts)
+        return path, final_abs_path, final_data, None
+    except Exception as e:
+        report_error(e, path)
+        return path, None, None, None
+
+def write_item(item, out, opts):
+    path, final_abs_path, final_data, result = item
+    if final_abs_path is None: return path, result
+    try:
+        return path, write_restored(final_abs_path, final_data, (), out, opts)
     except Exception as e:
-        if "Bad zip" not in str(e): tqdm.write(f"[Error] {os.path.basename(file_path)}: {e}")
+        report_error(e, path)
+        return path, None
+
+def run_threaded(files_to_proc, mapping, src, out, readers, decoders, writers, queue_size,
+                 on_done=None, opts=None, total=None):
+    opts = opts or {}
+    path_q, read_q, write_q = (queue.Queue(queue_size) for _ in range(3))
+    result_q = queue.Queue()
+    # 队列名 -> (队列, 深度累计, 最大深度)；队列经常是满的说明下游那一段是瓶颈
+    depth = {"待读": [path_q, 0, 0], "待解码": [read_q, 0, 0], "待写入": [write_q, 0, 0]}
+
+    feed_error = []
+    def feed():
+        # 扫描 / plan_output_dirs 等生成器出错时也要放结束标记，否则流水线永远等下去；异常交回主线程抛出
+        try:
+            for path in files_to_proc: path_q.put(path)
+        except BaseException as e:
+            feed_error.append(e)
+        finally:
+            for _ in range(readers): path_q.put(_DONE)
+    threading.Thread(target=feed, daemon=True).start()
+    start_stage(lambda p: read_item(p, opts), readers, path_q, read_q, decoders)
+    start_stage(lambda it: decode_item(it, mapping, src, out, opts), decoders, read_q, write_q, writers)
+    start_stage(lambda it: write_item(it, out, opts), writers, write_q, result_q, 1)
+
+    samples = 0
+    with tqdm(total=total, unit="file", ncols=100) as pbar:
+        while True:
+            item = result_q.get()
+            if item is _DONE: break
+            if on_done: on_done([item])
+            samples += 1
+            for stat in depth.values():
+                n = stat[0].qsize()
+                stat[1] += n
+                stat[2] = max(stat[2], n)
+            if samples % 64 == 0:
+                pbar.set_postfix_str(" ".join(f"{name}:{stat[0].qsize()}" for name, stat in depth.items()))
+            pbar.update(1)
+
+    if samples:
+        print(f"队列深度 (平均 / 最大 / 容量 {queue_size}): " +
+              ", ".join(f"{name} {stat[1] / samples:.1f} / {stat[2]}" for name, stat in depth.items()))
+    if feed_error: raise feed_error[0]
+
+def sync_all():
+    """--fsync end：全部写完后一次性刷盘"""
+    if hasattr(os, "sync"):
+        print("正在将输出写入磁盘 (sync)...")
+        os.sync()
+    else:
+        print("[提示] 当前系统不支持 os.sync，--fsync end 未生效，可改用 --fsync file")
+
+def run_profiled(fn, profiler, output_root):
+    """--profile：cProfile 结果存为 .prof (可用 snakeviz 等查看) 并打印累计耗时前 20 的函数；pyinstrument 存为 .html"""
+    os.makedirs(output_root, exist_ok=True)
+    if profiler == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument 未安装 (pip install pyinstrument)，本次不做性能剖析")
+            return fn()
+        prof = Profiler()
+        prof.start()
+        try:
+            return fn()
+        finally:
+            prof.stop()
+            path = os.path.join(output_root, PROFILE_NAME + ".html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(prof.output_html())
+            print(f"性能剖析已写入: {path}")
+
+    import cProfile
+    import pstats
+    prof = cProfile.Profile()
+    try:
+        return prof.runcall(fn)
+    finally:
+        path = os.path.join(output_root, PROFILE_NAME + ".prof")
+        prof.dump_stats(path)
+        pstats.Stats(prof).sort_stats("cumulative").print_stats(20)
+        print(f"性能剖析已写入: {path}")
 
 def main():
+    global STATS
+    args = parse_args()
     src, out, prots, bun = get_user_config()
     if not os.path.exists(src):
         print("源目录不存在！")
         return
 
-    full_map = load_mappings(prots, bun)
-
-    print(f"开始全量扫描: {src} ...")
-    files_to_proc = []
-    
     # [V6 核心改动]：不再限制目录，扫描所有子文件夹
-    for root, dirs, files in os.walk(src):
-        for f in files:
-            # 跳过脚本本身和解密出来的txt
-            if f.endswith(".py") or f.endswith(".txt"): continue
-            files_to_proc.append(os.path.join(root, f))
-
-    print(f"共发现 {len(files_to_proc)} 个文件，开始还原...")
-    
-    for f in tqdm(files_to_proc, unit="file", ncols=80):
-        decrypt_and_save(f, full_map, src, out)
+    # 扫描在后台线程里进行，扫到的文件直接交给还原引擎，不等整棵树扫完
+    out_abs = os.path.abspath(out)
+    pack_abs = os.path.abspath(args.pack) if args.pack else None
+
+    def skip_dir(entry):
+        # 输出目录默认在源目录里面，不能把上一次的输出再还原一遍；清单缓存目录也跳过
+        return entry.name == CACHE_DIR_NAME or os.path.abspath(entry.path) == out_abs
+
+    def skip_file(entry):
+        # 跳过脚本本身和解密出来的txt
+        if entry.name.endswith(".py") or entry.name.endswith(".txt"): return True
+        # 包和它旁边的增量状态库 (<包路径>.restore_state.sqlite 及 -wal/-shm)
+        return pack_abs is not None and os.path.abspath(entry.path).startswith(pack_abs)
+
+    scanned = [0]
+    def count_scanned(entries):
+        for entry in entries:
+            scanned[0] += 1
+            yield entry
+
+    scan_workers = max(1, args.scan_workers)
+    print(f"开始全量扫描: {src} (扫描线程: {scan_workers}) ...")
+    entries = count_scanned(scan_source(src, skip_dir, skip_file, scan_workers, want_stat=args.incremental))
+
+    if args.analyze:
+        analyze_mappings(prots, bun, (os.path.relpath(e.path, src).replace("\\", "/") for e in entries), args.analyze)
+        input("按回车键退出...")
+        return
+
+    full_map = load_mappings(prots, bun, os.path.join(out, DEFAULT_MAPPING_CACHE))
+
+    conn, on_done = None, None
+    skipped = [0]
+    if args.incremental:
+        # 包模式的记录放在包旁边，和散文件模式的输出目录记录分开；包被删掉时全量重做
+        default_db = args.pack + DEFAULT_STATE_DB if args.pack else os.path.join(out, DEFAULT_STATE_DB)
+        db_path = args.state_db or default_db
+        fingerprint = mapping_fingerprint(prots, bun) + "\n" + output_fingerprint(out, args.pack)
+        conn = open_state_db(db_path, fingerprint, reset=bool(args.pack) and not os.path.exists(args.pack))
+        file_stats = {}
+        # 包里的同名条目以新写入的为准，不去删输出目录里的散文件
+        files_to_proc = filter_unchanged(entries, load_state(conn), src, None if args.pack else out, file_stats, skipped)
+
+        def on_done(results):
+            rows = [state_row(p, r, file_stats, out) for p, r in results if r is not None]
+            if rows: save_state(conn, rows)
+    else:
+        files_to_proc = (entry.path for entry in entries)
+
+    opts = {'dedupe': args.dedupe, 'link_raw': args.link_raw, 'zip_all': args.zip_all, 'fsync': args.fsync}
+    if args.report:
+        # 各进程 (--engine process) 在 _init_worker 里各建一份，每批任务结束后合并到这里
+        STATS = RunStats()
+        opts['report'] = True
+    pack = None
+    if args.pack:
+        # 一个包只能由一个进程写，解码改用线程流水线；包里的条目不能互相链接，去重不生效
+        if args.dedupe: print("[提示] --pack 模式下 --dedupe 不生效")
+        args.engine = "thread"
+        pack = PackWriter(args.pack, append=args.incremental)
+        opts.update(pack=pack, dedupe=None)
+        print(f"还原结果写入包: {args.pack}")
+    else:
+        out_dirs = set()
+        files_to_proc = plan_output_dirs(files_to_proc, full_map, src, out, out_dirs)
+        opts['dirs_ready'] = True
+
+    workers = max(1, args.workers)
+    if args.engine == "thread":
+        readers, decoders, writers = max(1, args.readers), max(1, args.decoders), max(1, args.writers)
+        print(f"边扫描边还原 (线程: 读 {readers} / 解码 {decoders} / 写 {writers})...")
+    else:
+        print(f"边扫描边还原 (进程数: {workers})...")
+
+    def run():
+        if args.engine == "thread":
+            run_threaded(files_to_proc, full_map, src, out, readers, decoders, writers,
+                         max(1, args.queue_size), on_done, opts)
+        elif workers > 1:
+            run_parallel(files_to_proc, full_map, src, out, workers, max(1, args.chunk_size), on_done, opts)
+        else:
+            run_serial(files_to_proc, full_map, src, out, on_done, opts)
+
+    t0 = time.perf_counter()
+    try:
+        if args.profile: run_profiled(run, args.profile, out)
+        else: run()
+    finally:
+        if conn: conn.close()
+        print(f"共扫描到 {scanned[0]} 个文件")
+        if args.incremental: print(f"增量模式: {skipped[0]} 个文件未变化，已跳过")
+        if pack:
+            pack.close()
+            print(f"包内共写入 {pack.count} 个文件")
+        if STATS is not None:
+            elapsed = time.perf_counter() - t0
+            STATS.write(args.report, elapsed)
+            stages = ", ".join(f"{name} {sec:.2f}s" for name, sec in STATS.seconds.most_common())
+            print(f"耗时 {elapsed:.2f}s，各阶段累计 (所有进程/线程之和): {stages}")
+            print(f"运行报告已写入: {args.report}")
+
+    if args.fsync == "end":
+        sync_all()
 
     print(f"\n全部完成！")
     print(f"资源已输出至: {out}")
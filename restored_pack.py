@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import shutil
+import zipfile
+import threading
+import warnings
+
+# 还原包：不压缩 (ZIP_STORED) 的普通 ZIP，中央目录就是索引，任何 ZIP 工具都能直接打开
+# 条目名 = 散文件模式下相对于输出目录的路径，如 hotRes/spine_101.png、bundleRes/xxx.ab
+PACK_PREFIX = "hotRes/"     # organize 脚本处理的扁平化文件都在这里
+COPY_CHUNK = 1 << 20
+
+class PackWriter:
+    """
+    多个线程共用一个包，每个条目整段加锁写入
+    append=True 时在已有包后追加 (增量还原)；同名条目以最后写入的为准
+    """
+    def __init__(self, path, append=False):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        mode = "a" if append and os.path.exists(path) else "w"
+        self.path = path
+        self.zf = zipfile.ZipFile(path, mode, zipfile.ZIP_STORED, allowZip64=True)
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def add(self, arcname, first, chunks=(), stream=False):
+        """
+        写入一个条目，返回写入的字节数
+        stream 为 True 表示 chunks 里还有数据、总大小未知；否则整个条目就是 first
+        """
+        info = zipfile.ZipInfo(arcname.replace("\\", "/"), date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        if not stream: info.file_size = len(first)
+        with self.lock, warnings.catch_warnings():
+            # 增量追加时同名条目是预期的 (新内容覆盖旧内容)
+            warnings.simplefilter("ignore", UserWarning)
+            # 流式写入时总大小未知，按 ZIP64 写，超过 4 GB 也不出错；大小已知时由 zipfile 自己判断
+            with self.zf.open(info, "w", force_zip64=stream) as f:
+                size = f.write(first)
+                for chunk in chunks:
+                    size += f.write(chunk)
+            self.count += 1
+        return size
+
+    def close(self):
+        with self.lock:
+            self.zf.close()
+
+class PackReader:
+    """按还原后的文件名随机读取包内文件；只列出 prefix 目录下的一层 (与散文件模式下的 os.listdir 对应)"""
+    def __init__(self, path, prefix=PACK_PREFIX):
+        self.zf = zipfile.ZipFile(path)
+        self.names = {}
+        for info in self.zf.infolist():
+            name = info.filename
+            if info.is_dir() or not name.startswith(prefix): continue
+            rest = name[len(prefix):]
+            if "/" not in rest: self.names[rest] = name
+
+    def listdir(self):
+        return list(self.names)
+
+    def read(self, name):
+        return self.zf.read(self.names[name])
+
+    def extract(self, name, dst):
+        with self.zf.open(self.names[name]) as src, open(dst, "wb") as f:
+            shutil.copyfileobj(src, f, COPY_CHUNK)
+
+def open_pack_from_argv():
+    """organize 脚本的可选参数：python organize_xxx.py [还原包.zip]，不带参数时照旧处理当前目录的散文件"""
+    if len(sys.argv) < 2: return None
+    print(f"从还原包读取: {sys.argv[1]}")
+    return PackReader(sys.argv[1])
+
+def list_source_files(current_dir, pack=None):
+    if pack: return pack.listdir()
+    return [f for f in os.listdir(current_dir) if os.path.isfile(os.path.join(current_dir, f))]
+
+def take_file(current_dir, name, dst, pack=None):
+    """散文件模式下移动到 dst；包模式下从包里解出到 dst (包本身不改动)"""
+    if pack: pack.extract(name, dst)
+    else: shutil.move(os.path.join(current_dir, name), dst)
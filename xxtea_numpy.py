@@ -0,0 +1,71 @@
+import numpy as np
+
+# NumPy 版 XXTEA 解密：一次解密多份等长数据 (每份一列)，结果与 xxtea.decrypt(..., padding=False) 完全一致
+# XXTEA 每一轮里第 p 个字依赖刚解出的第 p+1 个字，单个文件内部无法并行，只能把多个文件排成二维数组同步推进
+DELTA = 0x9E3779B9
+
+def key_words(key):
+    """16 字节密钥 -> 4 个小端 uint32"""
+    if len(key) != 16: raise ValueError("XXTEA 密钥必须是 16 字节")
+    return [int(w) for w in np.frombuffer(key, dtype='<u4')]
+
+def decrypt_words(v, key):
+    """
+    v: (n, B) 的 uint32 数组，每列是一份数据 (n 个字)，原地解密
+    与 C 版 btea 的解密分支逐步对应
+    """
+    n = v.shape[0]
+    if n < 2: raise ValueError("XXTEA 数据至少需要 8 字节")
+    k = key_words(key)
+    rounds = 6 + 52 // n
+    total = (rounds * DELTA) & 0xFFFFFFFF
+    mx = np.empty_like(v[0])
+    tmp = np.empty_like(v[0])
+    y = v[0]
+    for _ in range(rounds):
+        s = np.uint32(total)
+        e = (total >> 2) & 3
+        for p in range(n - 1, -1, -1):
+            z = v[p - 1]     # p == 0 时即 v[n-1]
+            # MX = (((z >> 5) ^ (y << 2)) + ((y >> 3) ^ (z << 4))) ^ ((sum ^ y) + (k[(p & 3) ^ e] ^ z))
+            np.right_shift(z, 5, out=mx)
+            np.left_shift(y, 2, out=tmp)
+            np.bitwise_xor(mx, tmp, out=mx)
+            np.right_shift(y, 3, out=tmp)
+            np.bitwise_xor(tmp, np.left_shift(z, 4), out=tmp)
+            np.add(mx, tmp, out=mx)
+            np.bitwise_xor(y, s, out=tmp)
+            np.add(tmp, np.bitwise_xor(z, np.uint32(k[(p & 3) ^ e])), out=tmp)
+            np.bitwise_xor(mx, tmp, out=mx)
+            np.subtract(v[p], mx, out=v[p])
+            y = v[p]
+        total = (total - DELTA) & 0xFFFFFFFF
+    return v
+
+def decrypt_batch(bufs, key):
+    """
+    bufs: 等长、长度为 4 的倍数 (>= 8) 的若干份密文，返回解密后的 bytes 列表
+    """
+    if not bufs: return []
+    size = len(bufs[0])
+    if size % 4 or size < 8: raise ValueError("XXTEA 数据长度必须是 4 的倍数且不少于 8 字节")
+    if any(len(b) != size for b in bufs): raise ValueError("decrypt_batch 只接受等长数据，请先用 group_by_length 分组")
+    v = np.frombuffer(b"".join(bufs), dtype='<u4').reshape(len(bufs), size // 4).T.copy()
+    decrypt_words(v, key)
+    out = np.ascontiguousarray(v.T).tobytes()
+    return [out[i:i + size] for i in range(0, len(out), size)]
+
+def group_by_length(bufs):
+    """按长度分组，返回 {长度: [下标...]}，方便把一批文件拆成若干次 decrypt_batch"""
+    groups = {}
+    for i, b in enumerate(bufs):
+        groups.setdefault(len(b), []).append(i)
+    return groups
+
+def decrypt_many(bufs, key):
+    """任意长度的一批密文：按长度分组后批量解密，结果顺序与输入一致"""
+    result = [None] * len(bufs)
+    for idxs in group_by_length(bufs).values():
+        for i, dec in zip(idxs, decrypt_batch([bufs[i] for i in idxs], key)):
+            result[i] = dec
+    return result